@@ -1,7 +1,12 @@
+from sqlalchemy import select, func
 from sqlalchemy.orm import Session
 from . import models
 
 from datetime import datetime
+import pandas as pd
+
+# market_data columns used by the footprint and liquidity functions
+FOOTPRINT_COLUMNS = ['symbol', 'datetime', 'last_price', 'trades', 'total_volume', 'total_buying_volume', 'total_selling_volume']
 
 def get_market_data(db: Session, skip: int = 0, limit: int = 10):
     return db.query(models.MarketData).offset(skip).limit(limit).all()
@@ -16,4 +21,143 @@ def get_market_data_by_symbol_time(db: Session, symbol: str, start_time: datetim
         models.MarketData.symbol == symbol,
         models.MarketData.datetime >= start_time,
         models.MarketData.datetime <= end_time
-    ).all()
\ No newline at end of file
+    ).all()
+
+# Core select of only the requested market_data columns
+# symbols can be one symbol or a list; start_time/end_time are inclusive, since is exclusive, and after_id only keeps
+# rows with a larger id
+def select_market_data(symbols, start_time: datetime = None, end_time: datetime = None, since: datetime = None, columns: list = FOOTPRINT_COLUMNS, after_id: int = None):
+    table = models.MarketData.__table__
+    stmt = select(*[table.c[name] for name in columns])
+    if isinstance(symbols, str):
+        stmt = stmt.where(table.c.symbol == symbols)
+    else:
+        stmt = stmt.where(table.c.symbol.in_(list(symbols)))
+    if start_time is not None:
+        stmt = stmt.where(table.c.datetime >= start_time)
+    if end_time is not None:
+        stmt = stmt.where(table.c.datetime <= end_time)
+    if since is not None:
+        stmt = stmt.where(table.c.datetime > since)
+    if after_id is not None:
+        stmt = stmt.where(table.c.id > after_id)
+    return stmt.order_by(table.c.datetime)
+
+# fetch the selected columns as a DataFrame straight from the result rows (no ORM objects)
+def get_market_data_frame(db: Session, symbols, start_time: datetime = None, end_time: datetime = None, since: datetime = None, columns: list = FOOTPRINT_COLUMNS, after_id: int = None):
+    result = db.execute(select_market_data(symbols, start_time=start_time, end_time=end_time, since=since, columns=columns, after_id=after_id))
+    return pd.DataFrame.from_records(result.fetchall(), columns=columns)
+
+# stream the selected columns as DataFrames of at most chunk_size rows, in datetime order
+# (server-side cursor on Postgres, so only one chunk of rows is held in memory at a time)
+def iter_market_data_frames(db: Session, symbols, start_time: datetime = None, end_time: datetime = None, since: datetime = None, columns: list = FOOTPRINT_COLUMNS, chunk_size: int = 100000):
+    stmt = select_market_data(symbols, start_time=start_time, end_time=end_time, since=since, columns=columns)
+    result = db.execute(stmt.execution_options(stream_results=True, yield_per=chunk_size))
+    for rows in result.partitions():
+        yield pd.DataFrame.from_records(rows, columns=columns)
+
+# same as get_market_data_frame but returns {column: numpy array}
+def get_market_data_arrays(db: Session, symbols, start_time: datetime = None, end_time: datetime = None, since: datetime = None, columns: list = FOOTPRINT_COLUMNS):
+    df = get_market_data_frame(db, symbols, start_time=start_time, end_time=end_time, since=since, columns=columns)
+    return {name: df[name].to_numpy() for name in columns}
+
+# split a multi-symbol frame into {symbol: frame}; every requested symbol gets a frame, empty when it had no rows
+def partition_by_symbol(df, symbols):
+    groups = {symbol: frame.reset_index(drop=True) for symbol, frame in df.groupby('symbol', sort=False)}
+    empty = df.iloc[0:0]
+    return {symbol: groups.get(symbol, empty) for symbol in symbols}
+
+# fetch several symbols with one `symbol IN (...)` query and return {symbol: DataFrame}
+def get_market_data_frames(db: Session, symbols: list, start_time: datetime = None, end_time: datetime = None, since: datetime = None, columns: list = FOOTPRINT_COLUMNS):
+    df = get_market_data_frame(db, symbols, start_time=start_time, end_time=end_time, since=since, columns=columns)
+    return partition_by_symbol(df, symbols)
+
+# market_data rows of the given symbols with id above after_id (a polling watermark), in id order, at most limit rows
+def select_market_data_after_id(symbols, after_id: int, limit: int = None, columns: list = FOOTPRINT_COLUMNS):
+    table = models.MarketData.__table__
+    stmt = select(table.c.id, *[table.c[name] for name in columns]).where(table.c.id > after_id, table.c.symbol.in_(list(symbols)))
+    stmt = stmt.order_by(table.c.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+# same as select_market_data_after_id as a DataFrame with an 'id' column before the requested columns
+def get_market_data_after_id(db: Session, symbols, after_id: int, limit: int = None, columns: list = FOOTPRINT_COLUMNS):
+    result = db.execute(select_market_data_after_id(symbols, after_id, limit=limit, columns=columns))
+    return pd.DataFrame.from_records(result.fetchall(), columns=['id'] + list(columns))
+
+# smallest id of the rows of the given symbols at or after start_time (None when there are none)
+def get_first_market_data_id(db: Session, symbols, start_time: datetime):
+    table = models.MarketData.__table__
+    stmt = select(func.min(table.c.id)).where(table.c.symbol.in_(list(symbols)), table.c.datetime >= start_time)
+    return db.execute(stmt).scalar()
+
+# largest id in market_data (0 when it is empty)
+def get_max_market_data_id(db: Session):
+    table = models.MarketData.__table__
+    return db.execute(select(func.max(table.c.id))).scalar() or 0
+
+# first and last datetime stored for a symbol, (None, None) when it has no rows
+def get_market_data_time_bounds(db: Session, symbol: str):
+    table = models.MarketData.__table__
+    stmt = select(func.min(table.c.datetime), func.max(table.c.datetime)).where(table.c.symbol == symbol)
+    return tuple(db.execute(stmt).one())
+
+# number of market_data rows of a symbol between start_time and end_time (inclusive)
+def count_market_data(db: Session, symbol: str, start_time: datetime, end_time: datetime):
+    table = models.MarketData.__table__
+    stmt = select(func.count()).select_from(table).where(table.c.symbol == symbol, table.c.datetime >= start_time, table.c.datetime <= end_time)
+    return db.execute(stmt).scalar()
+
+# all symbols in market_data
+def get_symbols(db: Session):
+    table = models.MarketData.__table__
+    return [row[0] for row in db.execute(select(table.c.symbol).distinct())]
+
+# footprint_bars columns and their footprint names
+FOOTPRINT_BAR_COLUMNS = {'symbol': 'Symbol', 'minute': 'Time', 'price': 'Price', 'bid': 'Bid', 'ask': 'Ask', 'volume': 'Volume', 'trades': 'Trades'}
+
+# 1-minute footprint of one or several symbols from footprint_bars (start_time/end_time are inclusive minutes)
+# columns: Symbol, Time, Price, Bid, Ask, Volume, Trades, sorted by Symbol, Time, Price
+def get_footprint_bars(db: Session, symbols, start_time: datetime = None, end_time: datetime = None):
+    table = models.FootprintBar.__table__
+    stmt = select(*[table.c[name] for name in FOOTPRINT_BAR_COLUMNS])
+    if isinstance(symbols, str):
+        stmt = stmt.where(table.c.symbol == symbols)
+    else:
+        stmt = stmt.where(table.c.symbol.in_(list(symbols)))
+    if start_time is not None:
+        stmt = stmt.where(table.c.minute >= start_time)
+    if end_time is not None:
+        stmt = stmt.where(table.c.minute <= end_time)
+    stmt = stmt.order_by(table.c.symbol, table.c.minute, table.c.price)
+    return pd.DataFrame.from_records(db.execute(stmt).fetchall(), columns=list(FOOTPRINT_BAR_COLUMNS.values()))
+
+# insert or replace footprint bars (a footprint DataFrame with Symbol, Time, Price, Bid, Ask, Volume, Trades)
+def upsert_footprint_bars(db: Session, footprint, batch_size: int = 10000):
+    if footprint.empty:
+        return
+    table = models.FootprintBar.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f'footprint_bars upsert is not supported on {dialect}')
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['symbol', 'minute', 'price'],
+        set_={name: stmt.excluded[name] for name in ['bid', 'ask', 'volume', 'trades']},
+    )
+    records = footprint.rename(columns={v: k for k, v in FOOTPRINT_BAR_COLUMNS.items()})[list(FOOTPRINT_BAR_COLUMNS)]
+    records = records.astype(object).to_dict('records')
+    for i in range(0, len(records), batch_size):
+        db.execute(stmt, records[i:i + batch_size])
+
+def get_rollup_watermark(db: Session, symbol: str):
+    row = db.get(models.RollupWatermark, symbol)
+    return row.watermark if row is not None else None
+
+def set_rollup_watermark(db: Session, symbol: str, watermark: datetime):
+    db.merge(models.RollupWatermark(symbol=symbol, watermark=watermark))
@@ -0,0 +1,211 @@
+import numpy as np
+import pandas as pd
+
+from .instruments import DEFAULT_INSTRUMENT, prices_to_ticks, tick_sizes
+
+# Vectorized footprint detectors.
+# Every function here takes a footprint covering any number of candles (and symbols, when the footprint has
+# a 'Symbol' column) and returns all events found in one call, as a DataFrame with columns
+# ['Symbol', 'Event', 'Time', 'Price'] ('Symbol' only when the footprint has it).
+
+# columns that identify one candle in a footprint
+def candle_keys(footprint):
+    return [c for c in ('Symbol', 'Time') if c in footprint.columns]
+
+# integer tick of every row; with tick_size None, each row uses the tick size of its symbol (see app.instruments)
+def price_ticks(footprint, tick_size = None):
+    if tick_size is None:
+        tick_size = tick_sizes(footprint['Symbol']) if 'Symbol' in footprint.columns else DEFAULT_INSTRUMENT.tick_size
+    return prices_to_ticks(footprint['Price'].to_numpy(dtype=float), tick_size)
+
+def _empty_events(keys):
+    columns = ['Symbol', 'Event', 'Time', 'Price'] if 'Symbol' in keys else ['Event', 'Time', 'Price']
+    return pd.DataFrame(columns=columns)
+
+# Detect stacked selling and buying imbalances.
+# A price is imbalanced when Bid at the price and Ask one tick above differ by at least imbalance_param times
+# the smaller of the two (Bid > Ask: selling, Bid < Ask: buying). An event is signalled when stacked_param
+# contiguous ticks carry the same imbalance, at the highest price of the stack (one event per stack).
+def stacked_imbalances(footprint, tick_size = None, stacked_param = 3, imbalance_param = 3):
+    keys = candle_keys(footprint)
+    if footprint.empty:
+        return _empty_events(keys)
+    group = footprint.groupby(keys, sort=False).ngroup().to_numpy()
+    price = footprint['Price'].to_numpy(dtype=float)
+    ticks = price_ticks(footprint, tick_size)
+
+    # sort by candle, then price descending (the order the ladder is read in)
+    order = np.lexsort((-ticks, group))
+    group, ticks, price = group[order], ticks[order], price[order]
+    bid = footprint['Bid'].to_numpy(dtype=float)[order]
+    ask = footprint['Ask'].to_numpy(dtype=float)[order]
+
+    hits, flag = stacked_imbalance_runs(group, ticks, bid, ask, stacked_param, imbalance_param)
+    if len(hits) == 0:
+        return _empty_events(keys)
+
+    rows = footprint.iloc[order[hits]]
+    return _events(rows, keys, np.where(flag == 1, 'Selling Imbalance', 'Buying Imbalance'), price[hits])
+
+# Stacked-imbalance kernel on arrays sorted by candle (group), then tick descending.
+# Returns the positions where a stack starts (its highest price) and its flag (1: selling, 2: buying).
+def stacked_imbalance_runs(group, ticks, bid, ask, stacked_param, imbalance_param):
+    # the level one tick above is the previous row when it is in the same candle and exactly one tick higher
+    adjacent = np.zeros(len(ticks), dtype=bool)
+    adjacent[1:] = (group[1:] == group[:-1]) & (ticks[:-1] == ticks[1:] + 1)
+    ask_up = np.zeros(len(ticks))
+    ask_up[1:] = ask[:-1]
+
+    # |Bid - Ask| / min(Bid, Ask); missing levels and a zero side never count as an imbalance
+    low = np.minimum(bid, ask_up)
+    valid = adjacent & (low > 0)
+    ratio = np.zeros(len(ticks))
+    np.divide(np.abs(bid - ask_up), low, out=ratio, where=valid)
+    imbalanced = valid & (ratio >= imbalance_param)
+    # 0: none, 1: selling imbalance, 2: buying imbalance
+    flag = np.where(imbalanced & (bid > ask_up), 1, np.where(imbalanced & (bid < ask_up), 2, 0))
+
+    # run-length encode flags over contiguous ticks of the same candle
+    new_run = np.ones(len(ticks), dtype=bool)
+    new_run[1:] = ~adjacent[1:] | (flag[1:] != flag[:-1])
+    starts = np.flatnonzero(new_run)
+    lengths = np.diff(np.append(starts, len(ticks)))
+    hits = starts[(flag[starts] != 0) & (lengths >= stacked_param)]
+    return hits, flag[hits]
+
+# Stacked-imbalance kernel on one dense price ladder (bid and ask over every tick, lowest first, see app.ladder).
+# Same rule as stacked_imbalance_runs; every level has a neighbour one tick above, and untraded ticks (zero bid and
+# ask) never count. Returns the positions of the highest tick of every stack and its flag (1: selling, 2: buying).
+def ladder_imbalance_runs(bid, ask, stacked_param, imbalance_param):
+    below, above = bid[:-1], ask[1:]
+    low = np.minimum(below, above)
+    valid = low > 0
+    ratio = np.zeros(len(low))
+    np.divide(np.abs(below - above), low, out=ratio, where=valid)
+    imbalanced = valid & (ratio >= imbalance_param)
+    flag = np.where(imbalanced, np.where(below > above, 1, 2), 0)
+
+    # runs of equal flags; a stack is signalled at its last (highest) position
+    padded = np.concatenate(([-1], flag, [-1]))
+    bounds = np.flatnonzero(padded[1:] != padded[:-1])
+    starts, ends = bounds[:-1], bounds[1:] - 1
+    run_flag = flag[starts]
+    hit = (run_flag != 0) & (ends - starts + 1 >= stacked_param)
+    return ends[hit], run_flag[hit]
+
+# start index and size of each candle in arrays sorted by candle
+def _group_bounds(group):
+    starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+    sizes = np.diff(np.append(starts, len(group)))
+    return starts, sizes
+
+def _events(rows, keys, event, price):
+    result = pd.DataFrame({'Event': event, 'Time': rows['Time'].to_numpy(), 'Price': price})
+    if 'Symbol' in keys:
+        result.insert(loc=0, column='Symbol', value=rows['Symbol'].to_numpy())
+    return result
+
+# Detect volume clusters: the cluster_param highest-volume prices of a candle sit on cluster_param contiguous
+# ticks. The event is signalled at the highest price of the cluster.
+def volume_clusters(footprint, tick_size = None, cluster_param = 5):
+    keys = candle_keys(footprint)
+    if footprint.empty:
+        return _empty_events(keys)
+    group = footprint.groupby(keys, sort=False).ngroup().to_numpy()
+    price = footprint['Price'].to_numpy(dtype=float)
+    ticks = price_ticks(footprint, tick_size)
+    volume = footprint['Volume'].to_numpy(dtype=float)
+
+    # sort by candle, then volume descending (ties broken by the lower price)
+    order = np.lexsort((ticks, -volume, group))
+    starts, sizes = _group_bounds(group[order])
+    # the top cluster_param rows of each candle are at the start of its block
+    eligible = sizes >= cluster_param
+    top = starts[eligible][:, None] + np.arange(cluster_param)
+    top_ticks = ticks[order][top]
+    hit = top_ticks.max(axis=1) - top_ticks.min(axis=1) == cluster_param - 1
+    if not hit.any():
+        return _empty_events(keys)
+    top_price = price[order][top][hit].max(axis=1)
+    rows = footprint.iloc[order[starts[eligible][hit]]]
+    return _events(rows, keys, 'Volume Cluster', top_price)
+
+# Detect multiple high volume nodes: the highest-volume price of a candle is the same in n_node consecutive
+# candles of a symbol. The event is signalled on the candle that completes the n_node-th repeat.
+def multiple_high_volume_nodes(footprint, n_node = 2):
+    keys = candle_keys(footprint)
+    if footprint.empty:
+        return _empty_events(keys)
+    group = footprint.groupby(keys, sort=False).ngroup().to_numpy()
+    price = footprint['Price'].to_numpy(dtype=float)
+    volume = footprint['Volume'].to_numpy(dtype=float)
+
+    # highest-volume price of every candle, then candles in time order per symbol
+    order = np.lexsort((price, -volume, group))
+    starts, _ = _group_bounds(group[order])
+    candles = footprint.iloc[order[starts]].sort_values(by=keys, kind='stable')
+    top_price = candles['Price'].to_numpy(dtype=float)
+    new_run = np.ones(len(candles), dtype=bool)
+    new_run[1:] = top_price[1:] != top_price[:-1]
+    if 'Symbol' in keys:
+        symbol = candles['Symbol'].to_numpy()
+        new_run[1:] |= symbol[1:] != symbol[:-1]
+    run_starts = np.flatnonzero(new_run)
+    position = np.arange(len(candles)) - np.repeat(run_starts, np.diff(np.append(run_starts, len(candles)))) + 1
+    hit = (position == n_node) & (n_node > 1)
+    if not hit.any():
+        return _empty_events(keys)
+    return _events(candles[hit], keys, 'Multiple High Volume Node', top_price[hit])
+
+# lowest and highest price row of every candle (positions in footprint)
+def _candle_extremes(footprint, keys):
+    group = footprint.groupby(keys, sort=False).ngroup().to_numpy()
+    price = footprint['Price'].to_numpy(dtype=float)
+    order = np.lexsort((price, group))
+    starts, sizes = _group_bounds(group[order])
+    return order[starts], order[starts + sizes - 1]
+
+# Detect zero prints: Bid is zero at the lowest price (Bid Zero Print) or Ask is zero at the highest price
+# (Ask Zero Print) of a candle.
+def zero_prints(footprint):
+    keys = candle_keys(footprint)
+    if footprint.empty:
+        return _empty_events(keys)
+    low, high = _candle_extremes(footprint, keys)
+    low_rows = footprint.iloc[low][footprint['Bid'].to_numpy()[low] == 0]
+    high_rows = footprint.iloc[high][footprint['Ask'].to_numpy()[high] == 0]
+    return _sorted_events([
+        _events(low_rows, keys, 'Bid Zero Print', low_rows['Price'].to_numpy()),
+        _events(high_rows, keys, 'Ask Zero Print', high_rows['Price'].to_numpy()),
+    ], keys)
+
+# Detect failed auctions: Bid is not zero at the highest price (Failed Auction - Bid High) or Ask is not zero
+# at the lowest price (Failed Auction - Ask Low) of a candle.
+def failed_auctions(footprint):
+    keys = candle_keys(footprint)
+    if footprint.empty:
+        return _empty_events(keys)
+    low, high = _candle_extremes(footprint, keys)
+    high_rows = footprint.iloc[high][footprint['Bid'].to_numpy()[high] != 0]
+    low_rows = footprint.iloc[low][footprint['Ask'].to_numpy()[low] != 0]
+    return _sorted_events([
+        _events(high_rows, keys, 'Failed Auction - Bid High', high_rows['Price'].to_numpy()),
+        _events(low_rows, keys, 'Failed Auction - Ask Low', low_rows['Price'].to_numpy()),
+    ], keys)
+
+def _sorted_events(frames, keys):
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return _empty_events(keys)
+    return pd.concat(frames, ignore_index=True).sort_values(by=keys, kind='stable', ignore_index=True)
+
+# Run every detector over the whole footprint and return all events sorted by symbol and time
+def detect_all(footprint, tick_size = None, cluster_param = 5, stacked_param = 3, imbalance_param = 3, n_node = 2):
+    keys = candle_keys(footprint)
+    return _sorted_events([
+        volume_clusters(footprint, tick_size=tick_size, cluster_param=cluster_param),
+        stacked_imbalances(footprint, tick_size=tick_size, stacked_param=stacked_param, imbalance_param=imbalance_param),
+        multiple_high_volume_nodes(footprint, n_node=n_node),
+        zero_prints(footprint),
+        failed_auctions(footprint),
+    ], keys)
@@ -0,0 +1,138 @@
+import os
+import glob
+import json
+import argparse
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+
+# one fixed-size binary record per event (18 bytes); symbol and day are given by the file it is stored in
+RECORD_DTYPE = np.dtype([('time', '<M8[s]'), ('price', '<f8'), ('event', '<u2')])
+
+# Buffered event store.
+# Events are kept in memory and written once per cycle by flush(), one append per (symbol, day) file:
+# <root>/<symbol>/<YYYY-MM-DD>.bin, rotated to <YYYY-MM-DD>.1.bin, .2.bin ... when a file reaches max_bytes.
+# The directory layout is the index by symbol and time, so a query only reads the files of its symbols and days.
+# Event names are stored as codes; the code table is <root>/event_types.json.
+class EventStore:
+    def __init__(self, root = None, max_bytes = 64 * 1024 * 1024):
+        self.root = root or os.getenv('EVENT_STORE_DIR') or 'events'
+        self.max_bytes = max_bytes
+        self.buffer = []
+        self._lock = threading.Lock()
+        self.event_types = self._load_event_types()
+
+    def _event_types_path(self):
+        return os.path.join(self.root, 'event_types.json')
+
+    def _load_event_types(self):
+        if not os.path.exists(self._event_types_path()):
+            return []
+        with open(self._event_types_path()) as f:
+            return json.load(f)
+
+    def _event_code(self, event):
+        if event not in self.event_types:
+            self.event_types.append(event)
+            os.makedirs(self.root, exist_ok=True)
+            with open(self._event_types_path(), 'w') as f:
+                json.dump(self.event_types, f)
+        return self.event_types.index(event)
+
+    def add(self, symbol, event, time, price):
+        self.buffer.append((symbol, event, time, price))
+
+    # write the buffered events, one append per (symbol, day) file
+    def flush(self):
+        with self._lock:
+            events, self.buffer = self.buffer, []
+            if not events:
+                return 0
+            partitions = {}
+            for symbol, event, time, price in events:
+                time = pd.Timestamp(time)
+                partitions.setdefault((symbol, time.date()), []).append((time.to_datetime64(), price, self._event_code(event)))
+            for (symbol, day), records in partitions.items():
+                array = np.array(records, dtype=RECORD_DTYPE)
+                array.sort(order='time', kind='stable')
+                with open(self._writable_file(symbol, day, array.nbytes), 'ab') as f:
+                    array.tofile(f)
+            return len(events)
+
+    def symbol_dir(self, symbol):
+        return os.path.join(self.root, quote(symbol, safe=''))
+
+    # files of one symbol and day, in write order
+    def day_files(self, symbol, day):
+        first = os.path.join(self.symbol_dir(symbol), f'{day.isoformat()}.bin')
+        rotated = glob.glob(os.path.join(self.symbol_dir(symbol), f'{day.isoformat()}.*.bin'))
+        rotated.sort(key=lambda path: int(path.rsplit('.', 2)[1]))
+        return ([first] if os.path.exists(first) else []) + rotated
+
+    def _writable_file(self, symbol, day, nbytes):
+        os.makedirs(self.symbol_dir(symbol), exist_ok=True)
+        files = self.day_files(symbol, day)
+        if not files:
+            return os.path.join(self.symbol_dir(symbol), f'{day.isoformat()}.bin')
+        if os.path.getsize(files[-1]) + nbytes <= self.max_bytes:
+            return files[-1]
+        return os.path.join(self.symbol_dir(symbol), f'{day.isoformat()}.{len(files)}.bin')
+
+    def symbols(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(unquote(name) for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    # events of the given symbols (all by default) between start_time and end_time (inclusive)
+    # event keeps only event names containing it (case-insensitive), e.g. 'imbalance'
+    def read(self, symbols = None, start_time = datetime.min, end_time = datetime.max, event = None):
+        symbols = [symbols] if isinstance(symbols, str) else (symbols or self.symbols())
+        codes = None
+        if event is not None:
+            codes = [code for code, name in enumerate(self.event_types) if event.lower() in name.lower()]
+        frames = []
+        for symbol in symbols:
+            for day in self._days(symbol, start_time, end_time):
+                for path in self.day_files(symbol, day):
+                    records = np.fromfile(path, dtype=RECORD_DTYPE)
+                    mask = (records['time'] >= np.datetime64(start_time, 's')) & (records['time'] <= np.datetime64(end_time, 's'))
+                    if codes is not None:
+                        mask &= np.isin(records['event'], codes)
+                    records = records[mask]
+                    if len(records):
+                        frames.append(pd.DataFrame({
+                            'Symbol': symbol,
+                            'Event': np.array(self.event_types, dtype=object)[records['event']],
+                            'Time': records['time'],
+                            'Price': records['price'],
+                        }))
+        if not frames:
+            return pd.DataFrame(columns=['Symbol', 'Event', 'Time', 'Price'])
+        return pd.concat(frames, ignore_index=True).sort_values(by=['Symbol', 'Time'], kind='stable', ignore_index=True)
+
+    # days with files for symbol within the range
+    def _days(self, symbol, start_time, end_time):
+        if not os.path.isdir(self.symbol_dir(symbol)):
+            return []
+        days = sorted({datetime.strptime(name.split('.')[0], '%Y-%m-%d').date() for name in os.listdir(self.symbol_dir(symbol)) if name.endswith('.bin')})
+        return [day for day in days if start_time.date() <= day <= end_time.date()]
+
+# query stored events, e.g. all imbalances on ES last week:
+#   python -m app.event_store "ES 06-24" --days 7 --event imbalance
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Query the footprint event store')
+    parser.add_argument('symbols', nargs='*')
+    parser.add_argument('--start', type=datetime.fromisoformat, default=None)
+    parser.add_argument('--end', type=datetime.fromisoformat, default=None)
+    parser.add_argument('--days', type=int, default=None, help='only the last N days')
+    parser.add_argument('--event', default=None, help='keep event names containing this text')
+    parser.add_argument('--root', default=None)
+    args = parser.parse_args()
+
+    end_time = args.end or datetime.max
+    start_time = args.start or (datetime.now() - timedelta(days=args.days) if args.days else datetime.min)
+    events = EventStore(args.root).read(args.symbols or None, start_time, end_time, event=args.event)
+    print(events.to_string(index=False))
@@ -0,0 +1,103 @@
+import time
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .instruments import get_instrument, tick_sizes, prices_to_ticks, ticks_to_prices
+from .ladder import PriceLadder
+from .pipeline import Candle
+
+logger = logging.getLogger(__name__)
+
+# mask of the market_data rows whose last_price is a finite number
+def finite_prices(df):
+    return np.isfinite(df['last_price'].to_numpy(dtype=float))
+
+# 1-minute footprint of market_data rows: (Symbol, Time, Price) bins with Bid, Ask, Volume and traded volume (Trades)
+# rows are binned on their integer tick (see app.instruments), and Price is the exact price of the tick;
+# rows without a finite last_price (NULL, NaN) have no tick and are left out
+def footprint_one_minute(df):
+    df = df[finite_prices(df)]
+    tick_size = tick_sizes(df['symbol'])
+    footprint = pd.DataFrame({
+        'Symbol': df['symbol'],
+        'Time': pd.to_datetime(df['datetime']).dt.floor('Min'),
+        'Tick': prices_to_ticks(df['last_price'], tick_size),
+        'Bid': df['total_buying_volume'],
+        'Ask': df['total_selling_volume'],
+        'Volume': df['total_volume'],
+        'Trades': df['trades'],
+    })
+    footprint = footprint.groupby(['Symbol', 'Time', 'Tick'], sort=False).sum().reset_index()
+    price = ticks_to_prices(footprint['Tick'].to_numpy(), tick_sizes(footprint['Symbol']))
+    return footprint.drop(columns='Tick').assign(Price=price)[['Symbol', 'Time', 'Price', 'Bid', 'Ask', 'Volume', 'Trades']]
+
+# Stateful footprint builder for one symbol.
+# New market_data rows are added in place to one dense price ladder per minute (see app.ladder), so each cycle
+# only processes the rows that arrived since the last one instead of re-grouping the whole minute.
+# Dropped rows (late or without a price) are counted and logged as a warning at most once every warn_interval seconds.
+class FootprintAggregator:
+    def __init__(self, symbol, warn_interval = 60):
+        self.symbol = symbol
+        self.instrument = get_instrument(symbol)
+        # {minute: PriceLadder}
+        self.bins = {}
+        # every minute before this one has already been handed out as a candle
+        self.closed_until = None
+        # rows that arrived for a minute that was already closed
+        self.late_rows = 0
+        # rows dropped because their last_price was not a finite number
+        self.invalid_rows = 0
+        self.warn_interval = warn_interval
+        # (late_rows, invalid_rows) at the last warning, and when it was logged
+        self._reported = (0, 0)
+        self._last_report = None
+
+    # add new rows (a DataFrame with the market_data columns) to the open bins
+    def update(self, df):
+        if df.empty:
+            return
+        valid = finite_prices(df)
+        if not valid.all():
+            self.invalid_rows += int((~valid).sum())
+            df = df[valid]
+        minutes = pd.to_datetime(df['datetime']).dt.floor('Min')
+        ticks = self.instrument.to_ticks(df['last_price'])
+        bid = df['total_buying_volume'].to_numpy(dtype=float)
+        ask = df['total_selling_volume'].to_numpy(dtype=float)
+        volume = df['total_volume'].to_numpy(dtype=float)
+        for minute, rows in minutes.groupby(minutes).indices.items():
+            minute = pd.Timestamp(minute)
+            if self.closed_until is not None and minute < self.closed_until:
+                self.late_rows += len(rows)
+                continue
+            ladder = self.bins.get(minute)
+            if ladder is None:
+                ladder = self.bins[minute] = PriceLadder(self.instrument)
+            ladder.add(ticks[rows], bid[rows], ask[rows], volume[rows])
+        self._report_dropped()
+
+    # log the rows dropped since the last warning, rate limited to one warning per warn_interval seconds
+    def _report_dropped(self):
+        late, invalid = self.late_rows - self._reported[0], self.invalid_rows - self._reported[1]
+        if not (late or invalid):
+            return
+        now = time.monotonic()
+        if self._last_report is not None and now - self._last_report < self.warn_interval:
+            return
+        logger.warning('%s: dropped %d late rows (minute already closed) and %d rows without a price', self.symbol, late, invalid)
+        self._reported = (self.late_rows, self.invalid_rows)
+        self._last_report = now
+
+    # close every minute before `minute` and return their candles (app.pipeline.Candle) in time order
+    def close_candles(self, minute):
+        return [Candle(self.symbol, candle_time, ladder) for candle_time, ladder in self._close(minute)]
+
+    # pop the bins of every minute before `minute`, in time order
+    def _close(self, minute):
+        minute = pd.Timestamp(minute)
+        closed = [(candle_time, self.bins.pop(candle_time)) for candle_time in sorted(t for t in self.bins if t < minute)]
+        if self.closed_until is None or minute > self.closed_until:
+            self.closed_until = minute
+        return closed
@@ -0,0 +1,96 @@
+import os
+import json
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Contract specification of one instrument root (the part of a symbol before the space, 'MES' in 'MES 06-24').
+# tick_size is the minimum price increment, point_value the value of a 1.0 price move of one contract.
+class Instrument:
+    __slots__ = ('root', 'tick_size', 'point_value', 'ticks_per_point')
+
+    def __init__(self, root, tick_size, point_value):
+        self.root = root
+        self.tick_size = tick_size
+        self.point_value = point_value
+        # whole number of ticks per 1.0 (4 for 0.25), or None when the tick size is not a fraction 1/n
+        per_point = round(1 / tick_size)
+        self.ticks_per_point = per_point if per_point >= 1 and abs(1 / tick_size - per_point) < 1e-9 else None
+
+    def __repr__(self):
+        return f'Instrument({self.root!r}, tick_size={self.tick_size}, point_value={self.point_value})'
+
+    @property
+    def tick_value(self):
+        return self.tick_size * self.point_value
+
+    def to_ticks(self, price):
+        return prices_to_ticks(price, self.tick_size)
+
+    # (same as ticks_to_prices, without the per-row tick sizes)
+    def to_price(self, ticks):
+        if self.ticks_per_point is not None:
+            return ticks / self.ticks_per_point
+        return ticks * self.tick_size
+
+# integer tick of a price (or an array of prices); tick_size may be an array of the same length
+def prices_to_ticks(price, tick_size):
+    return np.rint(np.asarray(price, dtype=float) / tick_size).astype(np.int64)
+
+# price of a tick (or an array of ticks) as the closest float to the exact price: ticks are divided by the number
+# of ticks per point when it is a whole number (0.1 -> / 10) instead of multiplied by an inexact tick size
+def ticks_to_prices(ticks, tick_size):
+    tick_size = np.asarray(tick_size, dtype=float)
+    per_point = np.rint(1 / tick_size)
+    exact = np.abs(1 / tick_size - per_point) < 1e-9
+    return np.where(exact, np.asarray(ticks) / np.where(exact, per_point, 1), np.asarray(ticks) * tick_size)
+
+# CME contract specifications of the traded roots; INSTRUMENTS_FILE (JSON, {"ES": {"tick_size": 0.25, "point_value": 50}})
+# adds or overrides roots
+INSTRUMENTS = {
+    'ES': Instrument('ES', 0.25, 50),
+    'MES': Instrument('MES', 0.25, 5),
+    'NQ': Instrument('NQ', 0.25, 20),
+    'MNQ': Instrument('MNQ', 0.25, 2),
+    'YM': Instrument('YM', 1, 5),
+    'MYM': Instrument('MYM', 1, 0.5),
+    'RTY': Instrument('RTY', 0.1, 50),
+    'M2K': Instrument('M2K', 0.1, 5),
+    'CL': Instrument('CL', 0.01, 1000),
+    'MCL': Instrument('MCL', 0.01, 100),
+    'GC': Instrument('GC', 0.1, 100),
+    'MGC': Instrument('MGC', 0.1, 10),
+}
+
+# used for symbols whose root is not configured (the tick size the detectors assumed before per-symbol config)
+DEFAULT_INSTRUMENT = Instrument(None, 0.25, 1)
+
+def load_instruments(path):
+    with open(path) as f:
+        return {root: Instrument(root, float(spec['tick_size']), float(spec.get('point_value', 1))) for root, spec in json.load(f).items()}
+
+if os.getenv('INSTRUMENTS_FILE'):
+    INSTRUMENTS.update(load_instruments(os.getenv('INSTRUMENTS_FILE')))
+
+_warned = set()
+
+def symbol_root(symbol):
+    return symbol.split(' ', 1)[0]
+
+def get_instrument(symbol):
+    root = symbol_root(symbol)
+    instrument = INSTRUMENTS.get(root)
+    if instrument is None:
+        if root not in _warned:
+            _warned.add(root)
+            logger.warning('No instrument config for %s, using tick size %s', root, DEFAULT_INSTRUMENT.tick_size)
+        return DEFAULT_INSTRUMENT
+    return instrument
+
+# tick size of every row of a Series of symbols (looked up once per distinct symbol)
+def tick_sizes(symbols):
+    codes, uniques = pd.factorize(symbols)
+    return np.array([get_instrument(symbol).tick_size for symbol in uniques], dtype=float)[codes]
@@ -0,0 +1,100 @@
+import numpy as np
+
+from .instruments import DEFAULT_INSTRUMENT
+
+# Dense price ladder of one candle, keyed by integer tick offset.
+# Level i is the tick low + i; bid, ask and volume are contiguous float arrays over every tick from the lowest to the
+# highest traded one, and traded marks the ticks that actually traded (the others are zero). Rows are added by tick
+# with np.bincount, so there is no hashing or float comparison of prices, and neighbouring ticks are neighbouring
+# array elements.
+class PriceLadder:
+    __slots__ = ('instrument', 'low', 'bid', 'ask', 'volume', 'traded')
+
+    def __init__(self, instrument = DEFAULT_INSTRUMENT):
+        self.instrument = instrument
+        self.low = 0
+        self.bid = np.zeros(0)
+        self.ask = np.zeros(0)
+        self.volume = np.zeros(0)
+        self.traded = np.zeros(0, dtype=bool)
+
+    @classmethod
+    def from_ticks(cls, instrument, ticks, bid, ask, volume):
+        ladder = cls(instrument)
+        ladder.add(ticks, bid, ask, volume)
+        return ladder
+
+    @classmethod
+    def from_prices(cls, instrument, price, bid, ask, volume):
+        return cls.from_ticks(instrument, instrument.to_ticks(price), bid, ask, volume)
+
+    # add rows (arrays of ticks, bid, ask and volume; ticks may repeat) to the ladder
+    def add(self, ticks, bid, ask, volume):
+        ticks = np.asarray(ticks, dtype=np.int64)
+        if len(ticks) == 0:
+            return
+        self._extend(int(ticks.min()), int(ticks.max()))
+        index = ticks - self.low
+        size = len(self.traded)
+        self.bid += np.bincount(index, weights=bid, minlength=size)
+        self.ask += np.bincount(index, weights=ask, minlength=size)
+        self.volume += np.bincount(index, weights=volume, minlength=size)
+        self.traded[index] = True
+
+    # add another ladder of the same instrument level by level (e.g. a closed candle into a session profile)
+    def merge(self, other):
+        if len(other) == 0:
+            return
+        self._extend(other.low, other.high)
+        start = other.low - self.low
+        end = start + len(other)
+        self.bid[start:end] += other.bid
+        self.ask[start:end] += other.ask
+        self.volume[start:end] += other.volume
+        self.traded[start:end] |= other.traded
+
+    # grow the arrays to cover the ticks low..high
+    def _extend(self, low, high):
+        if len(self.traded) == 0:
+            self.low = low
+            size = high - low + 1
+            self.bid, self.ask, self.volume = np.zeros(size), np.zeros(size), np.zeros(size)
+            self.traded = np.zeros(size, dtype=bool)
+            return
+        new_low, new_high = min(low, self.low), max(high, self.high)
+        if new_low == self.low and new_high == self.high:
+            return
+        offset = self.low - new_low
+        size = new_high - new_low + 1
+        for name in ('bid', 'ask', 'volume', 'traded'):
+            old = getattr(self, name)
+            array = np.zeros(size, dtype=old.dtype)
+            array[offset:offset + len(old)] = old
+            setattr(self, name, array)
+        self.low = new_low
+
+    def __len__(self):
+        return len(self.traded)
+
+    @property
+    def high(self):
+        return self.low + len(self.traded) - 1
+
+    # tick of every level
+    @property
+    def ticks(self):
+        return np.arange(self.low, self.low + len(self.traded), dtype=np.int64)
+
+    # price of every level
+    @property
+    def prices(self):
+        return self.instrument.to_price(self.ticks)
+
+    # positions of the traded levels, lowest price first
+    @property
+    def levels(self):
+        return np.flatnonzero(self.traded)
+
+    # price of the level at position i
+    def price(self, i):
+        return self.instrument.to_price(self.low + int(i))
@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# timing of one stage; set .rows inside the with block to record a row count
+class _Stage:
+    __slots__ = ('metrics', 'ticker', 'name', 'rows', 'started')
+
+    def __init__(self, metrics, ticker, name):
+        self.metrics = metrics
+        self.ticker = ticker
+        self.name = name
+        self.rows = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.ticker, self.name, time.perf_counter() - self.started, self.rows)
+        return False
+
+# shared stage returned when metrics are disabled: nothing is timed or stored
+class _NullStage:
+    __slots__ = ('rows',)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+# Per-ticker, per-stage timings and row counts of the detection loop.
+# The last `window` samples of every (ticker, stage) are kept as a rolling window and summarized as p50/p95/p99.
+# The 'close' stage is the latency of every closed candle, from the end of its minute until its events were detected
+# and queued for sending; a candle closing more than close_budget seconds late is logged as a warning. The numbers
+# can be served as JSON on a local port (GET /metrics) and/or dumped to a file every dump_interval seconds.
+# When disabled, stage() returns a shared no-op context manager and nothing is recorded.
+class Metrics:
+    def __init__(self, enabled = True, window = 1000, close_budget = 2.0, dump_path = None, dump_interval = 60):
+        self.enabled = enabled
+        self.window = window
+        self.close_budget = close_budget
+        self.dump_path = dump_path
+        self.dump_interval = dump_interval
+        # {(ticker, stage): deque of seconds}, {(ticker, stage): deque of row counts}
+        self.timings = {}
+        self.rows = {}
+        self._lock = threading.Lock()
+        self._cycle_started = None
+        self._last_dump = time.monotonic()
+        self._server = None
+
+    # configuration from METRICS_ENABLED, METRICS_CLOSE_BUDGET, METRICS_DUMP_PATH, METRICS_DUMP_INTERVAL and METRICS_PORT
+    @classmethod
+    def from_env(cls):
+        metrics = cls(
+            enabled=os.getenv('METRICS_ENABLED', '0').lower() in ('1', 'true', 'yes'),
+            close_budget=float(os.getenv('METRICS_CLOSE_BUDGET') or 2.0),
+            dump_path=os.getenv('METRICS_DUMP_PATH') or None,
+            dump_interval=float(os.getenv('METRICS_DUMP_INTERVAL') or 60),
+        )
+        if metrics.enabled and os.getenv('METRICS_PORT'):
+            metrics.serve(int(os.getenv('METRICS_PORT')))
+        return metrics
+
+    def stage(self, ticker, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, ticker, name)
+
+    def record(self, ticker, name, seconds, rows = None):
+        key = (ticker, name)
+        timings = self.timings.get(key)
+        if timings is None:
+            with self._lock:
+                timings = self.timings.setdefault(key, deque(maxlen=self.window))
+                self.rows.setdefault(key, deque(maxlen=self.window))
+        timings.append(seconds)
+        if rows is not None:
+            self.rows[key].append(rows)
+
+    def start_cycle(self):
+        if self.enabled:
+            self._cycle_started = time.perf_counter()
+
+    # end of a cycle: record its duration and its lag behind the minute boundary it processed
+    def end_cycle(self, cycle_time):
+        if not self.enabled or self._cycle_started is None:
+            return
+        self.record('*', 'cycle', time.perf_counter() - self._cycle_started)
+        self.record('*', 'cycle_lag', (datetime.now() - cycle_time).total_seconds())
+        if self.dump_path and time.monotonic() - self._last_dump >= self.dump_interval:
+            self.dump(self.dump_path)
+
+    # a candle of `ticker` starting at candle_time (a 1-minute candle) has been evaluated and its events queued:
+    # record its latency behind the end of the minute as the 'close' stage
+    def record_close(self, ticker, candle_time, minutes = 1):
+        if not self.enabled:
+            return
+        latency = (datetime.now() - candle_time).total_seconds() - 60 * minutes
+        self.record(ticker, 'close', latency)
+        if latency > self.close_budget:
+            logger.warning('%s candle %s closed %.2fs after its minute ended, more than the %ss budget. Slowest stages: %s', ticker, candle_time, latency, self.close_budget, self.slowest())
+
+    # the n stages with the highest p95
+    def slowest(self, n = 3):
+        stats = self.snapshot()['stages']
+        ranked = sorted(stats, key=lambda s: s['p95'], reverse=True)[:n]
+        return ', '.join(f"{s['ticker']}/{s['stage']} p95={s['p95']:.3f}s" for s in ranked)
+
+    def snapshot(self):
+        stages = []
+        for (ticker, name), timings in list(self.timings.items()):
+            values = np.fromiter(list(timings), dtype=float)
+            if len(values) == 0:
+                continue
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            rows = list(self.rows[(ticker, name)])
+            stages.append({
+                'ticker': ticker,
+                'stage': name,
+                'count': len(values),
+                'p50': p50,
+                'p95': p95,
+                'p99': p99,
+                'max': values.max(),
+                'last': values[-1],
+                'rows_last': rows[-1] if rows else None,
+                'rows_mean': float(np.mean(rows)) if rows else None,
+            })
+        return {'time': datetime.now().isoformat(timespec='seconds'), 'stages': stages}
+
+    def dump(self, path):
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f, indent=1)
+        os.replace(tmp, path)
+        self._last_dump = time.monotonic()
+
+    # serve the snapshot as JSON on http://host:port/metrics from a background thread
+    def serve(self, port, host = '127.0.0.1'):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') != '/metrics':
+                    self.send_error(404)
+                    return
+                body = json.dumps(metrics.snapshot()).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True).start()
+        return self._server
+
+# metrics that record nothing (default for callers that are not instrumented)
+NULL_METRICS = Metrics(enabled=False)
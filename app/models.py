@@ -1,13 +1,15 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
 
 class MarketData(Base):
     __tablename__ = 'market_data'
+    # time-range scans are always for given symbols (the index also serves lookups by symbol alone)
+    __table_args__ = (Index('ix_market_data_symbol_datetime', 'symbol', 'datetime'),)
     
     id = Column(Integer, primary_key=True, index=True)
-    symbol = Column(String, index=True)
+    symbol = Column(String)
     datetime = Column(DateTime)
     last_price = Column(Float)
     trades = Column(Integer)
@@ -31,3 +33,41 @@ class MarketData(Base):
     max_seen_delta = Column(Integer)
     min_seen_delta = Column(Integer)
     cumulative_delta = Column(Integer)
+
+# 1-minute footprint bins of market_data, maintained by app.rollup
+class FootprintBar(Base):
+    __tablename__ = 'footprint_bars'
+
+    symbol = Column(String, primary_key=True)
+    minute = Column(DateTime, primary_key=True)
+    price = Column(Float, primary_key=True)
+    bid = Column(Integer)
+    ask = Column(Integer)
+    volume = Column(Integer)
+    trades = Column(Integer)
+
+# every minute of a symbol before its watermark is rolled up into footprint_bars
+class RollupWatermark(Base):
+    __tablename__ = 'footprint_rollup_watermarks'
+
+    symbol = Column(String, primary_key=True)
+    watermark = Column(DateTime)
+
+# create_all() only creates indexes together with a new table, so add the missing ones to existing tables.
+# On Postgres they are built with CREATE INDEX CONCURRENTLY on an autocommit connection, so the ingest writer's
+# inserts into market_data are not blocked while a large table is indexed.
+def create_indexes(bind):
+    engine = getattr(bind, 'engine', bind)
+    if engine.dialect.name != 'postgresql':
+        for index in MarketData.__table__.indexes:
+            index.create(bind=engine, checkfirst=True)
+        return
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        for index in MarketData.__table__.indexes:
+            columns = ', '.join(column.name for column in index.columns)
+            connection.execute(text(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {index.name} ON {index.table.name} ({columns})'))
+
+# create the missing tables and indexes (called by the entry points, never at import time)
+def init_db(bind):
+    Base.metadata.create_all(bind=bind)
+    create_indexes(bind)
@@ -1,16 +1,197 @@
 from telegram import Bot
+from telegram.error import RetryAfter
+from telegram.request import HTTPXRequest
 from dotenv import load_dotenv
 import os
+import time
+import queue
+import atexit
 import asyncio
+import logging
+import threading
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+CHAT_ID = os.getenv('CHAT_ID') or '-4268783657'
+# Telegram rejects messages longer than this
+MAX_MESSAGE_LENGTH = 4096
+
 async def send_async_message(message):
     token = os.getenv('BOT_TOKEN')
-    chat_id = '-4268783657'
+    chat_id = CHAT_ID
     bot = Bot(token=token)
     await bot.send_message(chat_id=chat_id, text=message)
 
+# markers put on the queue next to messages
+_FLUSH = object()
+_STOP = object()
+
+# Background notification service.
+# The detection loop only puts messages on a queue (submit never waits on the network). A worker thread owns one
+# event loop and one Bot (one connection pool), merges the messages of a cycle into as few Telegram messages as
+# possible, keeps at least min_interval seconds between sends and retries failed sends.
+# base_url can point the bot at a local fake Telegram endpoint (e.g. 'http://127.0.0.1:8081/bot').
+class NotificationDispatcher:
+    def __init__(self, token=None, chat_id=CHAT_ID, base_url=None, linger=1.0, min_interval=1.0, max_retries=3, max_queue=1000):
+        self.token = token or os.getenv('BOT_TOKEN')
+        self.chat_id = chat_id
+        self.base_url = base_url or os.getenv('BOT_API_URL') or None
+        # how long to wait for more messages of the same cycle before sending (a flush sends right away)
+        self.linger = linger
+        self.min_interval = min_interval
+        self.max_retries = max_retries
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+        self._last_send = 0.0
+        self._thread = threading.Thread(target=self._run, name='notification-dispatcher', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    # queue a message; never blocks (the message is dropped if the queue is full or the worker has stopped)
+    def submit(self, message):
+        if self._thread.ident is not None and not self._thread.is_alive():
+            self.dropped += 1
+            logger.error('Notification worker is not running, dropped: %s', message)
+            return
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning('Notification queue full, dropped: %s', message)
+
+    # end of a detection cycle: send what has been queued so far without waiting for linger
+    def flush(self):
+        try:
+            self.queue.put_nowait(_FLUSH)
+        except queue.Full:
+            pass
+
+    # send everything still queued and stop the worker
+    def close(self, timeout=10):
+        if self._thread.is_alive():
+            self.queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _make_bot(self):
+        request = HTTPXRequest(connection_pool_size=4)
+        if self.base_url:
+            return Bot(token=self.token, base_url=self.base_url, request=request)
+        return Bot(token=self.token, request=request)
+
+    # without a bot (e.g. BOT_TOKEN is not set) the worker keeps draining the queue and counts every text as failed,
+    # so the queue never fills up
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        bot = None
+        try:
+            bot = self._make_bot()
+        except Exception as e:
+            logger.error('Notification bot could not be created: %s', e)
+        if bot is not None:
+            try:
+                loop.run_until_complete(bot.initialize())
+            except Exception as e:
+                logger.error('Notification bot could not be initialized: %s', e)
+        try:
+            while True:
+                batch, stop = self._next_batch()
+                for text in self._pack(batch):
+                    if bot is None:
+                        self.failed += 1
+                        logger.error('Notification dropped, no bot: %s', text)
+                        continue
+                    loop.run_until_complete(self._send(bot, text))
+                if stop:
+                    break
+        finally:
+            if bot is not None:
+                try:
+                    loop.run_until_complete(bot.shutdown())
+                except Exception as e:
+                    logger.warning('Notification bot could not be shut down: %s', e)
+            loop.close()
+
+    # block for the first message, then collect more until a flush, a stop or the linger time runs out
+    def _next_batch(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                return batch, False
+            if item is _STOP:
+                return batch, True
+            if item is _FLUSH:
+                if batch:
+                    return batch, False
+                continue
+            batch.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + self.linger
+
+    # merge messages into as few texts as Telegram accepts
+    @staticmethod
+    def _pack(messages):
+        texts = []
+        current = ''
+        for message in messages:
+            message = message[:MAX_MESSAGE_LENGTH]
+            if current and len(current) + 1 + len(message) > MAX_MESSAGE_LENGTH:
+                texts.append(current)
+                current = ''
+            current = f'{current}\n{message}' if current else message
+        if current:
+            texts.append(current)
+        return texts
+
+    async def _send(self, bot, text):
+        for attempt in range(self.max_retries + 1):
+            # rate limit: keep min_interval between two sends to the chat
+            wait = self._last_send + self.min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                await bot.send_message(chat_id=self.chat_id, text=text)
+                self._last_send = time.monotonic()
+                self.sent += 1
+                return
+            except RetryAfter as e:
+                # Telegram tells how long to back off
+                delay = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+            except Exception as e:
+                logger.warning('Notification failed (attempt %d): %s', attempt + 1, e)
+                delay = 2 ** attempt
+            self._last_send = time.monotonic()
+            if attempt < self.max_retries:
+                await asyncio.sleep(delay)
+        self.failed += 1
+        logger.error('Notification dropped after %d attempts: %s', self.max_retries + 1, text)
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+# shared dispatcher, started on first use and drained when the process exits
+def get_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = NotificationDispatcher().start()
+            atexit.register(_dispatcher.close)
+    return _dispatcher
+
+# queue a message for the background dispatcher (returns immediately)
 def sent_msg(message):
-    asyncio.run(send_async_message(message))
+    get_dispatcher().submit(message)
 
+# mark the end of a detection cycle so its messages are sent together
+def flush():
+    if _dispatcher is not None:
+        _dispatcher.flush()
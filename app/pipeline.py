@@ -0,0 +1,132 @@
+import numpy as np
+
+from .detectors import ladder_imbalance_runs
+from .instruments import get_instrument
+from .ladder import PriceLadder
+from .metrics import NULL_METRICS
+
+# One detected event
+class Event:
+    __slots__ = ('symbol', 'event', 'time', 'price')
+
+    def __init__(self, symbol, event, time, price):
+        self.symbol = symbol
+        self.event = event
+        self.time = time
+        self.price = price
+
+    def __repr__(self):
+        return f'Event({self.symbol!r}, {self.event!r}, {self.time!r}, {self.price!r})'
+
+    # notification text
+    def message(self):
+        return f"{self.symbol}: {self.event} at {self.price} USD at {self.time.strftime('%Y-%m-%d %H:%M')}"
+
+# One footprint candle on a dense price ladder (see app.ladder), shared by every detector.
+# by_volume (positions of the traded levels by volume descending, ties by the lower price) is computed on first use
+# and then reused.
+class Candle:
+    __slots__ = ('symbol', 'time', 'ladder', '_by_volume')
+
+    def __init__(self, symbol, time, ladder):
+        self.symbol = symbol
+        self.time = time
+        self.ladder = ladder
+        self._by_volume = None
+
+    # candle from a single-candle footprint DataFrame (Time, Price, Bid, Ask, Volume)
+    @classmethod
+    def from_frame(cls, footprint, symbol = None):
+        if symbol is None:
+            symbol = footprint['Symbol'].iloc[0]
+        ladder = PriceLadder.from_prices(get_instrument(symbol), footprint['Price'].to_numpy(dtype=float), footprint['Bid'].to_numpy(dtype=float),
+                                         footprint['Ask'].to_numpy(dtype=float), footprint['Volume'].to_numpy(dtype=float))
+        return cls(symbol, footprint['Time'].iloc[0], ladder)
+
+    @property
+    def by_volume(self):
+        if self._by_volume is None:
+            levels = self.ladder.levels
+            self._by_volume = levels[np.lexsort((levels, -self.ladder.volume[levels]))]
+        return self._by_volume
+
+# registered detectors: name -> (function, default parameters), in registration order
+# a detector is called as detector(candle, state, **params) and returns a list of Event; state is a dict kept
+# per (symbol, detector) between candles
+DETECTORS = {}
+
+def register(name, **defaults):
+    def decorator(func):
+        DETECTORS[name] = (func, defaults)
+        return func
+    return decorator
+
+@register('volume_cluster', cluster_param=5)
+def volume_cluster(candle, state, cluster_param):
+    top = candle.by_volume[:cluster_param]
+    if len(top) < cluster_param:
+        return []
+    # positions on the ladder are tick offsets
+    if top.max() - top.min() == cluster_param - 1:
+        return [Event(candle.symbol, 'Volume Cluster', candle.time, candle.ladder.price(top.max()))]
+    return []
+
+@register('imbalance', stacked_param=3, imbalance_param=3)
+def imbalance(candle, state, stacked_param, imbalance_param):
+    ladder = candle.ladder
+    hits, flags = ladder_imbalance_runs(ladder.bid, ladder.ask, stacked_param, imbalance_param)
+    # stacks are reported from the highest price down
+    return [Event(candle.symbol, 'Selling Imbalance' if flag == 1 else 'Buying Imbalance', candle.time, ladder.price(hit)) for hit, flag in zip(hits[::-1], flags[::-1])]
+
+@register('multiple_high_volume_node', n_node=2)
+def multiple_high_volume_node(candle, state, n_node):
+    top = candle.by_volume[0]
+    tick = candle.ladder.low + int(top)
+    events = []
+    if tick == state.get('last_tick'):
+        state['count'] = state.get('count', 1) + 1
+        if state['count'] == n_node:
+            events.append(Event(candle.symbol, 'Multiple High Volume Node', candle.time, candle.ladder.price(top)))
+    else:
+        state['count'] = 1
+    state['last_tick'] = tick
+    return events
+
+# the lowest and highest ticks of a ladder are always traded levels
+@register('zero_print')
+def zero_print(candle, state):
+    ladder = candle.ladder
+    events = []
+    if ladder.bid[0] == 0:
+        events.append(Event(candle.symbol, 'Bid Zero Print', candle.time, ladder.price(0)))
+    if ladder.ask[-1] == 0:
+        events.append(Event(candle.symbol, 'Ask Zero Print', candle.time, ladder.price(len(ladder) - 1)))
+    return events
+
+@register('failed_auction')
+def failed_auction(candle, state):
+    ladder = candle.ladder
+    events = []
+    if ladder.bid[-1] != 0:
+        events.append(Event(candle.symbol, 'Failed Auction - Bid High', candle.time, ladder.price(len(ladder) - 1)))
+    if ladder.ask[0] != 0:
+        events.append(Event(candle.symbol, 'Failed Auction - Ask Low', candle.time, ladder.price(0)))
+    return events
+
+# Runs the registered detectors (all by default, or the given names) on closed candles.
+# params overrides detector parameters: {'imbalance': {'stacked_param': 4}}
+class DetectorPipeline:
+    def __init__(self, names = None, params = None):
+        names = names or list(DETECTORS)
+        params = params or {}
+        self.detectors = [(name, DETECTORS[name][0], {**DETECTORS[name][1], **params.get(name, {})}) for name in names]
+        # {(symbol, detector): state}
+        self.states = {}
+
+    def run(self, candle, metrics = NULL_METRICS):
+        events = []
+        for name, detector, params in self.detectors:
+            state = self.states.setdefault((candle.symbol, name), {})
+            with metrics.stage(candle.symbol, name):
+                events.extend(detector(candle, state, **params))
+        return events
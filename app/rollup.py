@@ -0,0 +1,70 @@
+import argparse
+import logging
+from datetime import datetime, timedelta
+
+from . import models, crud
+from .database import SessionLocal, engine
+from .footprint import footprint_one_minute
+from .scheduler import MinuteScheduler
+
+logger = logging.getLogger(__name__)
+
+# Incremental rollup of market_data into footprint_bars.
+# Each symbol has a watermark: every minute before it is already rolled up. A run only aggregates the minutes that
+# closed since the watermark (plus lookback_minutes before it, to pick up rows that arrived late) and upserts them,
+# at most max_span at a time so a long backlog does not load into memory at once.
+def rollup_symbol(db, symbol, until, lookback_minutes = 1, max_span = timedelta(days=1)):
+    until = until.replace(second=0, microsecond=0)
+    watermark = crud.get_rollup_watermark(db, symbol)
+    if watermark is None:
+        first, _ = crud.get_market_data_time_bounds(db, symbol)
+        if first is None:
+            return 0
+        watermark = first.replace(second=0, microsecond=0)
+    else:
+        watermark = watermark - timedelta(minutes=lookback_minutes)
+
+    rows = 0
+    while watermark < until:
+        span_end = min(watermark + max_span, until)
+        # only full minutes: [watermark, span_end)
+        df = crud.get_market_data_frame(db, symbol, start_time=watermark, end_time=span_end - timedelta(microseconds=1))
+        bars = footprint_one_minute(df) if not df.empty else df
+        crud.upsert_footprint_bars(db, bars)
+        crud.set_rollup_watermark(db, symbol, span_end)
+        db.commit()
+        rows += len(bars)
+        watermark = span_end
+    return rows
+
+# roll up every closed minute of the given symbols (all symbols in market_data by default)
+def rollup(symbols = None, until = None):
+    until = until or datetime.now()
+    with SessionLocal() as db:
+        for symbol in symbols or crud.get_symbols(db):
+            rows = rollup_symbol(db, symbol, until)
+            logger.info('%s: %d footprint bars rolled up until %s', symbol, rows, until.replace(second=0, microsecond=0))
+
+# keep footprint_bars up to date: roll up every symbol offset_ms after each minute closes
+def run(symbols = None, offset_ms = 500, max_workers = 4):
+    with SessionLocal() as db:
+        symbols = symbols or crud.get_symbols(db)
+
+    def job(symbol, cycle_time, data):
+        with SessionLocal() as db:
+            rollup_symbol(db, symbol, cycle_time)
+
+    MinuteScheduler(offset_ms=offset_ms, max_workers=max_workers).run(symbols, job)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    models.init_db(engine)
+    parser = argparse.ArgumentParser(description='Roll up market_data into 1-minute footprint_bars')
+    parser.add_argument('--symbols', nargs='+', default=None)
+    parser.add_argument('--once', action='store_true', help='roll up the closed minutes once and exit')
+    args = parser.parse_args()
+
+    if args.once:
+        rollup(args.symbols)
+    else:
+        run(args.symbols)
@@ -0,0 +1,61 @@
+import time
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+# Runs a job for every ticker once per interval, aligned to the wall clock.
+# Each cycle wakes offset_ms after an interval boundary (e.g. 500 ms after every minute closes), fans the tickers
+# out to a bounded thread pool and hands every job the boundary it is processing, so a boundary is never processed
+# twice and cycle start does not drift with the number of tickers. A cycle that takes longer than its budget is
+# reported, and boundaries missed because of it are reported as skipped (the next cycle covers them).
+# before_cycle(cycle_time) can load the data of all tickers at once; it returns {ticker: data} and every job is
+# called as job(ticker, cycle_time, data) (data is None for tickers missing from the dict).
+class MinuteScheduler:
+    def __init__(self, interval=60, offset_ms=500, max_workers=8, budget=None):
+        self.interval = interval
+        self.offset = offset_ms / 1000
+        self.max_workers = max_workers
+        # time a cycle may take before it is reported as overrun (default: until the next wake up)
+        self.budget = budget if budget is not None else interval
+        self.last_boundary = None
+
+    # epoch second of the next boundary after `now`
+    def next_boundary(self, now):
+        return (now // self.interval + 1) * self.interval
+
+    def run(self, tickers, job, before_cycle=None, after_cycle=None, cycles=None):
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ticker') as executor:
+            count = 0
+            while cycles is None or count < cycles:
+                # sleep until offset after the next boundary
+                boundary = self.next_boundary(time.time() - self.offset)
+                time.sleep(max(boundary + self.offset - time.time(), 0))
+                self.run_cycle(executor, tickers, job, boundary, before_cycle, after_cycle)
+                count += 1
+
+    def run_cycle(self, executor, tickers, job, boundary, before_cycle=None, after_cycle=None):
+        if self.last_boundary is not None:
+            if boundary <= self.last_boundary:
+                return
+            skipped = int((boundary - self.last_boundary) // self.interval) - 1
+            if skipped > 0:
+                logger.warning('Skipped %d cycle(s) before %s', skipped, datetime.fromtimestamp(boundary))
+        self.last_boundary = boundary
+        cycle_time = datetime.fromtimestamp(boundary)
+        started = time.perf_counter()
+
+        data = before_cycle(cycle_time) if before_cycle is not None else {}
+        futures = {executor.submit(job, ticker, cycle_time, data.get(ticker)): ticker for ticker in tickers}
+        done, _ = wait(futures)
+        for future in done:
+            if future.exception() is not None:
+                logger.error('%s failed at %s: %s', futures[future], cycle_time, future.exception())
+        if after_cycle is not None:
+            after_cycle(cycle_time)
+
+        elapsed = time.perf_counter() - started
+        if elapsed > self.budget:
+            logger.warning('Cycle %s overran its budget: %.2fs > %.2fs for %d tickers', cycle_time, elapsed, self.budget, len(tickers))
+        return elapsed
@@ -0,0 +1,160 @@
+import os
+import json
+import shutil
+from datetime import datetime, time, timedelta
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from . import crud
+
+# columns stored per partition (the symbol is the partition itself)
+CACHE_COLUMNS = [name for name in crud.FOOTPRINT_COLUMNS if name != 'symbol']
+# columns fetched for a partition (the id is only kept as the largest one, in meta.json)
+FETCH_COLUMNS = ['id'] + crud.FOOTPRINT_COLUMNS
+
+# On-disk columnar cache of market_data, partitioned by symbol and day.
+# A partition is a directory <root>/<symbol>/<YYYY-MM-DD>/ with one .npy file per column and a meta.json.
+# A day is marked complete once the database holds rows of the symbol later than the end of that day plus `grace`
+# (so rows still being ingested, or timestamps behind the local clock, do not freeze a partial day); later runs load
+# complete days with memory-mapped (zero-copy) np.load and never query them again. Missing days are fetched with one
+# query per run of consecutive days. An incomplete day is only re-read when its row count in the database changed:
+# then the rows with an id above the largest cached one are added, or the whole day is fetched again when the counts
+# still differ (rows that became visible with a lower id).
+class TickCache:
+    def __init__(self, root=None, grace=timedelta(minutes=10)):
+        self.root = root or os.getenv('TICK_CACHE_DIR') or '.tick_cache'
+        self.grace = grace
+
+    def partition_dir(self, symbol, day):
+        return os.path.join(self.root, quote(symbol, safe=''), day.isoformat())
+
+    def read_meta(self, symbol, day):
+        path = os.path.join(self.partition_dir(symbol, day), 'meta.json')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    # memory-mapped columns of one partition
+    def read_partition(self, symbol, day):
+        directory = self.partition_dir(symbol, day)
+        return {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in CACHE_COLUMNS}
+
+    # replace the meta.json of an existing partition
+    def write_meta(self, symbol, day, meta):
+        path = os.path.join(self.partition_dir(symbol, day), 'meta.json')
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(f'{path}.tmp', path)
+
+    # df has the CACHE_COLUMNS in datetime order; last_id is the largest market_data id it holds
+    def write_partition(self, symbol, day, df, complete, last_id):
+        directory = self.partition_dir(symbol, day)
+        os.makedirs(os.path.dirname(directory), exist_ok=True)
+        tmp = f'{directory}.tmp-{os.getpid()}'
+        os.makedirs(tmp, exist_ok=True)
+        for name in CACHE_COLUMNS:
+            np.save(os.path.join(tmp, f'{name}.npy'), _column_array(df, name))
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({'complete': complete, 'rows': len(df), 'last_id': last_id}, f)
+        # swap the new partition in
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.rename(tmp, directory)
+
+    # market_data rows of symbol between start_time and end_time (inclusive), with the crud.FOOTPRINT_COLUMNS
+    def load(self, db, symbol, start_time, end_time):
+        first, last = crud.get_market_data_time_bounds(db, symbol)
+        if first is None:
+            return pd.DataFrame(columns=crud.FOOTPRINT_COLUMNS)
+        start_time = max(start_time, first)
+        end_time = min(end_time, last)
+        if start_time > end_time:
+            return pd.DataFrame(columns=crud.FOOTPRINT_COLUMNS)
+
+        days = [start_time.date() + timedelta(days=i) for i in range((end_time.date() - start_time.date()).days + 1)]
+        metas = {day: self.read_meta(symbol, day) for day in days}
+
+        # fetch missing days, one query per run of consecutive missing days
+        for run in _consecutive_runs([day for day in days if metas[day] is None]):
+            df = crud.get_market_data_frame(db, symbol, start_time=datetime.combine(run[0], time.min), end_time=datetime.combine(run[-1], time.max), columns=FETCH_COLUMNS)
+            days_of_rows = df['datetime'].dt.date if not df.empty else pd.Series(dtype=object)
+            for day in run:
+                rows = df[days_of_rows == day] if not df.empty else df
+                self.write_partition(symbol, day, rows, complete=self._is_final(day, last), last_id=_last_id(rows))
+                # freshly written, nothing to extend
+                metas[day] = True
+
+        # bring incomplete days (and partitions written before last_id was kept) up to date
+        for day in days:
+            meta = metas[day]
+            if isinstance(meta, dict) and not (meta['complete'] and 'last_id' in meta):
+                self._extend(db, symbol, day, meta, complete=self._is_final(day, last))
+
+        # zero-copy loads of every partition, each cut to the requested range before anything is copied
+        start, end = np.datetime64(start_time), np.datetime64(end_time)
+        parts = []
+        for day in days:
+            part = self.read_partition(symbol, day)
+            times = part['datetime']
+            lo, hi = np.searchsorted(times, start, side='left'), np.searchsorted(times, end, side='right')
+            parts.append({name: values[lo:hi] for name, values in part.items()})
+        # empty slices do not take part (the columns of an empty day have no meaningful dtype)
+        parts = [part for part in parts if len(part['datetime'])] or parts[:1]
+        if len(parts) == 1:
+            columns = parts[0]
+        else:
+            columns = {name: np.concatenate([part[name] for part in parts]) for name in CACHE_COLUMNS}
+        df = pd.DataFrame(columns)
+        df.insert(loc=0, column='symbol', value=symbol)
+        return df
+
+    # True when the symbol's newest row (last) is later than the end of day plus the grace period
+    def _is_final(self, day, last):
+        return last > datetime.combine(day, time.max) + self.grace
+
+    def _extend(self, db, symbol, day, meta, complete):
+        day_start, day_end = datetime.combine(day, time.min), datetime.combine(day, time.max)
+        count = crud.count_market_data(db, symbol, day_start, day_end)
+        if 'last_id' in meta and count == meta['rows']:
+            if complete:
+                self.write_meta(symbol, day, {**meta, 'complete': True})
+            return
+        if 'last_id' in meta:
+            new = crud.get_market_data_frame(db, symbol, start_time=day_start, end_time=day_end, after_id=meta['last_id'] if meta['last_id'] is not None else 0, columns=FETCH_COLUMNS)
+            if meta['rows'] + len(new) == count:
+                cached = pd.DataFrame(self.read_partition(symbol, day))
+                df = pd.concat([cached, new[CACHE_COLUMNS]], ignore_index=True) if len(cached) else new[CACHE_COLUMNS]
+                # late rows may be older than the cached ones
+                df = df.sort_values(by='datetime', kind='stable')
+                last_id = max(meta['last_id'] or 0, _last_id(new) or 0) or None
+                self.write_partition(symbol, day, df, complete=complete, last_id=last_id)
+                return
+        # rows are missing below the largest cached id: fetch the whole day again
+        df = crud.get_market_data_frame(db, symbol, start_time=day_start, end_time=day_end, columns=FETCH_COLUMNS)
+        self.write_partition(symbol, day, df, complete=complete, last_id=_last_id(df))
+
+# largest market_data id of fetched rows (None when there are none)
+def _last_id(df):
+    return int(df['id'].max()) if not df.empty else None
+
+# column as a contiguous array (datetime64[us]; nullable integer columns become float)
+def _column_array(df, name):
+    if name == 'datetime':
+        return pd.to_datetime(df[name]).to_numpy(dtype='datetime64[us]')
+    values = df[name].to_numpy()
+    if values.dtype == object:
+        values = pd.to_numeric(df[name]).to_numpy(dtype=float)
+    return np.ascontiguousarray(values)
+
+# split sorted days into runs of consecutive days
+def _consecutive_runs(days):
+    runs = []
+    for day in days:
+        if runs and runs[-1][-1] + timedelta(days=1) == day:
+            runs[-1].append(day)
+        else:
+            runs.append([day])
+    return runs
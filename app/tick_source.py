@@ -0,0 +1,57 @@
+import logging
+
+from . import crud
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Source of new market_data rows for the live loop.
+# poll() returns the rows that arrived since the previous call as {symbol: DataFrame} (market_data columns, every
+# symbol present, empty when it had nothing new) and must be cheap when nothing arrived, since it is called several
+# times a second. caught_up is False while rows that had already arrived are still waiting to be handed out (e.g. a
+# backlog after an outage), so the caller must not close minutes yet. A push-based source (e.g. Postgres LISTEN/NOTIFY) would collect rows from its listener in the
+# background and hand them out from poll() the same way.
+class TickSource:
+    def __init__(self, symbols):
+        self.symbols = list(symbols)
+        self.caught_up = True
+
+    def poll(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+# Polls market_data for rows with an id above the last one seen (the watermark).
+# This assumes a single writer inserting into market_data, so ids become visible in increasing order. Then every row
+# is handed out exactly once, whatever its datetime: late rows are not missed and rows at a minute boundary are not
+# read twice. With several concurrent writers (e.g. on Postgres), a transaction holding a lower id can commit after
+# the watermark has passed it, and that row is never handed out. At most batch_size rows are read per poll; the rest come with the next polls, and a
+# full batch leaves caught_up False until a poll returns less than batch_size rows.
+# If a query fails, the watermark does not move and the same rows are read again by the next poll.
+class PollingTickSource(TickSource):
+    def __init__(self, symbols, after_id = None, batch_size = 100000, session_factory = SessionLocal):
+        super().__init__(symbols)
+        self.after_id = after_id
+        self.batch_size = batch_size
+        self.session_factory = session_factory
+
+    # start with the first row at or after start_time (or after the newest row when there is none yet)
+    def start_at(self, start_time):
+        with self.session_factory() as db:
+            first_id = crud.get_first_market_data_id(db, self.symbols, start_time)
+            self.after_id = first_id - 1 if first_id is not None else crud.get_max_market_data_id(db)
+        logger.info('Polling %s from id %d', ', '.join(self.symbols), self.after_id)
+        return self.after_id
+
+    def poll(self):
+        if self.after_id is None:
+            raise RuntimeError('PollingTickSource has no watermark, call start_at() first')
+        with self.session_factory() as db:
+            df = crud.get_market_data_after_id(db, self.symbols, self.after_id, limit=self.batch_size)
+        self.caught_up = len(df) < self.batch_size
+        if not df.empty:
+            self.after_id = int(df['id'].iloc[-1])
+            # rows of one symbol in time order, whatever order their ids were assigned in
+            df = df.sort_values(by='datetime', kind='stable')
+        return crud.partition_by_symbol(df, self.symbols)
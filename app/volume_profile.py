@@ -0,0 +1,244 @@
+import os
+import argparse
+from datetime import datetime, time, timedelta
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from .instruments import get_instrument
+from .ladder import PriceLadder
+from .pipeline import Candle
+
+# daily session start, in the time zone of market_data.datetime (e.g. SESSION_START=17:00)
+SESSION_START = time.fromisoformat(os.getenv('SESSION_START') or '18:00')
+
+# Session volume profile of one symbol.
+# Cumulative bid, ask and volume per tick live on one dense PriceLadder, and each closed candle's ladder is added
+# to it level by level (O(candle levels), no raw rows). Volume only grows, so the point of control can only move to
+# a level the candle touched, and it is kept up to date on every add. The value area, top-N nodes and high/low
+# volume nodes are computed from the ladder on demand and cached until the next candle.
+# A session starts every day at session_start (in the time zone of market_data.datetime); the first candle of a new
+# session resets the profile. save()/load() keep it across restarts as an .npz snapshot, and candles at or before
+# the last one added are ignored, so candles replayed after a restart are not counted twice.
+class SessionVolumeProfile:
+    def __init__(self, symbol, session_start = SESSION_START, value_area = 0.7):
+        self.symbol = symbol
+        self.instrument = get_instrument(symbol)
+        self.session_start = session_start
+        self.value_area_fraction = value_area
+        self.reset(None)
+
+    # start an empty profile for the session starting at `session`
+    def reset(self, session):
+        self.session = session
+        self.ladder = PriceLadder(self.instrument)
+        self.total_volume = 0.0
+        # tick of the point of control (None while empty)
+        self.poc_tick = None
+        self.last_time = None
+        self._cache = {}
+
+    # start of the session a candle time belongs to
+    def session_of(self, candle_time):
+        candle_time = pd.Timestamp(candle_time)
+        start = pd.Timestamp(datetime.combine(candle_time.date(), self.session_start))
+        return start if candle_time >= start else start - timedelta(days=1)
+
+    # add one closed candle (an app.pipeline.Candle); returns False when it was already included
+    def add_candle(self, candle):
+        candle_time = pd.Timestamp(candle.time)
+        if self.last_time is not None and candle_time <= self.last_time:
+            return False
+        session = self.session_of(candle_time)
+        if session != self.session:
+            self.reset(session)
+        ladder = candle.ladder
+        self.ladder.merge(ladder)
+        self.total_volume += float(ladder.volume.sum())
+        self.last_time = candle_time
+        self._update_poc(ladder)
+        self._cache = {}
+        return True
+
+    # add every candle of a footprint DataFrame (Time, Price, Bid, Ask, Volume), e.g. from footprint_bars;
+    # returns the number of candles added
+    def add_footprint(self, footprint):
+        added = 0
+        for _, candle in footprint.sort_values(by='Time', kind='stable').groupby('Time', sort=True):
+            added += self.add_candle(Candle.from_frame(candle, symbol=self.symbol))
+        return added
+
+    # only the levels of the candle can overtake the point of control
+    def _update_poc(self, candle_ladder):
+        volume = self.ladder.volume
+        start = candle_ladder.low - self.ladder.low
+        touched = start + int(np.argmax(volume[start:start + len(candle_ladder)]))
+        poc = self.poc
+        # highest volume wins, ties go to the lower price
+        if poc is None or volume[touched] > volume[poc] or (volume[touched] == volume[poc] and touched < poc):
+            self.poc_tick = self.ladder.low + touched
+
+    # position of the point of control on the ladder
+    @property
+    def poc(self):
+        return self.poc_tick - self.ladder.low if self.poc_tick is not None else None
+
+    @property
+    def poc_price(self):
+        return self.instrument.to_price(self.poc_tick) if self.poc_tick is not None else None
+
+    # (low price, high price) of the smallest range around the point of control holding value_area of the volume,
+    # grown one level at a time toward the side with more volume
+    def value_area(self):
+        if 'value_area' not in self._cache:
+            self._cache['value_area'] = self._value_area()
+        return self._cache['value_area']
+
+    def _value_area(self):
+        if self.poc is None:
+            return None
+        volume = self.ladder.volume
+        target = self.value_area_fraction * self.total_volume
+        low = high = self.poc
+        covered = volume[self.poc]
+        while covered < target and (low > 0 or high < len(volume) - 1):
+            up = volume[high + 1] if high < len(volume) - 1 else -1
+            down = volume[low - 1] if low > 0 else -1
+            if up >= down:
+                high += 1
+                covered += up
+            else:
+                low -= 1
+                covered += down
+        return self.ladder.price(low), self.ladder.price(high)
+
+    # the n highest-volume levels as a DataFrame (Price, Bid, Ask, Volume), highest volume first
+    def top_nodes(self, n = 5):
+        levels = self.ladder.levels
+        n = min(n, len(levels))
+        if n == 0:
+            return pd.DataFrame(columns=['Price', 'Bid', 'Ask', 'Volume'])
+        volume = self.ladder.volume[levels]
+        top = np.argpartition(-volume, n - 1)[:n]
+        top = top[np.lexsort((top, -volume[top]))]
+        return self._levels_frame(levels[top])
+
+    # high and low volume nodes: peaks and troughs of the volume profile smoothed over 2 * window + 1 ticks.
+    # Peaks at or above the mean are high volume nodes; troughs at or below the mean, inside the traded range, are
+    # low volume nodes. Returns (high volume node prices, low volume node prices), lowest price first.
+    def volume_nodes(self, window = 2):
+        key = ('volume_nodes', window)
+        if key not in self._cache:
+            self._cache[key] = self._volume_nodes(window)
+        return self._cache[key]
+
+    def _volume_nodes(self, window):
+        if len(self.ladder) < 3:
+            return [], []
+        smooth = np.convolve(self.ladder.volume, np.ones(2 * window + 1) / (2 * window + 1), mode='same')
+        mean = smooth.mean()
+        inner = np.arange(1, len(smooth) - 1)
+        left, centre, right = smooth[:-2], smooth[1:-1], smooth[2:]
+        peaks = inner[(centre > left) & (centre >= right) & (centre >= mean)]
+        troughs = inner[(centre < left) & (centre <= right) & (centre <= mean)]
+        prices = self.ladder.prices
+        return prices[peaks].tolist(), prices[troughs].tolist()
+
+    def _levels_frame(self, positions):
+        return pd.DataFrame({
+            'Price': self.ladder.prices[positions],
+            'Bid': self.ladder.bid[positions],
+            'Ask': self.ladder.ask[positions],
+            'Volume': self.ladder.volume[positions],
+        })
+
+    # every traded level of the session, lowest price first
+    def to_frame(self):
+        return self._levels_frame(self.ladder.levels)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = f'{path}.tmp-{os.getpid()}.npz'
+        np.savez(tmp, symbol=self.symbol, low=self.ladder.low, bid=self.ladder.bid, ask=self.ladder.ask, volume=self.ladder.volume, traded=self.ladder.traded,
+                 session=np.datetime64(self.session, 'ns') if self.session is not None else np.datetime64('NaT'),
+                 last_time=np.datetime64(self.last_time, 'ns') if self.last_time is not None else np.datetime64('NaT'))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, session_start = SESSION_START, value_area = 0.7):
+        with np.load(path) as data:
+            profile = cls(str(data['symbol']), session_start=session_start, value_area=value_area)
+            ladder = profile.ladder
+            ladder.low = int(data['low'])
+            ladder.bid, ladder.ask, ladder.volume, ladder.traded = data['bid'], data['ask'], data['volume'], data['traded']
+            profile.session = pd.Timestamp(data['session'][()]) if not np.isnat(data['session']) else None
+            profile.last_time = pd.Timestamp(data['last_time'][()]) if not np.isnat(data['last_time']) else None
+        profile.total_volume = float(ladder.volume.sum())
+        if len(ladder):
+            profile.poc_tick = ladder.low + int(np.argmax(ladder.volume))
+        return profile
+
+# snapshots of the profiles kept by main.py, one .npz per symbol in VOLUME_PROFILE_DIR (default volume_profiles)
+def profile_path(symbol, root = None):
+    root = root or os.getenv('VOLUME_PROFILE_DIR') or 'volume_profiles'
+    return os.path.join(root, f"{quote(symbol, safe='')}.npz")
+
+# profile of symbol from its snapshot, or a new empty one
+def load_profile(symbol, root = None, session_start = SESSION_START):
+    path = profile_path(symbol, root)
+    if os.path.exists(path):
+        return SessionVolumeProfile.load(path, session_start=session_start)
+    return SessionVolumeProfile(symbol, session_start=session_start)
+
+# add the candles of the current session that closed after the profile's last candle and before `until` (a minute),
+# e.g. the candles missed while main.py was stopped. Minutes already rolled up (see app.rollup) come from
+# footprint_bars, the rest from market_data. Returns the number of candles added.
+def catch_up(profile, db, until):
+    from . import crud
+    from .footprint import footprint_one_minute
+    until = pd.Timestamp(until)
+    start = profile.session_of(until)
+    if profile.last_time is not None:
+        start = max(start, profile.last_time + timedelta(minutes=1))
+    if start >= until:
+        return 0
+    added = 0
+    watermark = crud.get_rollup_watermark(db, profile.symbol)
+    rolled_up = min(pd.Timestamp(watermark), until) if watermark is not None else start
+    if rolled_up > start:
+        added += profile.add_footprint(crud.get_footprint_bars(db, profile.symbol, start_time=start.to_pydatetime(), end_time=(rolled_up - timedelta(microseconds=1)).to_pydatetime()))
+    if rolled_up < until:
+        df = crud.get_market_data_frame(db, profile.symbol, start_time=max(start, rolled_up).to_pydatetime(), end_time=(until - timedelta(microseconds=1)).to_pydatetime())
+        if not df.empty:
+            added += profile.add_footprint(footprint_one_minute(df))
+    return added
+
+# print the current session profile of a symbol:
+#   python -m app.volume_profile "ES 06-24" --top 10
+# --rebuild recomputes it from footprint_bars (see app.rollup) and saves the snapshot
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Session volume profile')
+    parser.add_argument('symbol')
+    parser.add_argument('--top', type=int, default=5)
+    parser.add_argument('--root', default=None)
+    parser.add_argument('--rebuild', action='store_true', help='rebuild the current session from footprint_bars')
+    args = parser.parse_args()
+
+    if args.rebuild:
+        from . import crud
+        from .database import SessionLocal
+        profile = SessionVolumeProfile(args.symbol)
+        session = profile.session_of(datetime.now())
+        with SessionLocal() as db:
+            profile.add_footprint(crud.get_footprint_bars(db, args.symbol, start_time=session.to_pydatetime()))
+        profile.save(profile_path(args.symbol, args.root))
+    else:
+        profile = load_profile(args.symbol, args.root)
+
+    high_nodes, low_nodes = profile.volume_nodes()
+    print(f'{profile.symbol} session {profile.session}, last candle {profile.last_time}, volume {profile.total_volume:.0f}')
+    print(f'POC {profile.poc_price}, value area {profile.value_area()}')
+    print(f'High volume nodes {high_nodes}')
+    print(f'Low volume nodes {low_nodes}')
+    print(profile.top_nodes(args.top).to_string(index=False))
@@ -0,0 +1,154 @@
+import os
+import json
+import shutil
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+# Benchmarks of the footprint and liquidity pipelines on synthetic data in a local SQLite database.
+# Every benchmark prints one JSON line (rows, best time, throughput and peak traced memory, with the git commit) so
+# results of two commits can be compared with --compare.
+#
+#   python -m benchmarks.run --sizes 1000 100000 --output bench.jsonl
+#   python -m benchmarks.run --sizes 1000 100000 --compare bench.jsonl
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# best wall time of `repeat` runs, then one more run under tracemalloc for the peak memory
+def measure(func, repeat = 3, memory = True):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return best, peak
+
+def run(sizes, repeat = 3, memory = True, max_candles = 500, workdir = None):
+    workdir = workdir or tempfile.mkdtemp(prefix='metrixx_bench_')
+    os.makedirs(workdir, exist_ok=True)
+    database = os.path.abspath(os.path.join(workdir, 'bench.db'))
+    # the app reads these at import time
+    os.environ['DATABASE_URL'] = f"sqlite:///{database}"
+    os.environ['TICK_CACHE_DIR'] = os.path.join(workdir, 'tick_cache')
+    from sqlalchemy import delete
+    import main
+    import liquidity_index
+    from app import models, detectors
+    from app.pipeline import Candle, DetectorPipeline
+    from app.database import engine, SessionLocal
+    from benchmarks.synthetic import generate_ticks, load_market_data
+
+    # market_data is emptied below: refuse to run when app.database was imported earlier with another database
+    if engine.url.get_backend_name() != 'sqlite' or not engine.url.database or os.path.abspath(engine.url.database) != database:
+        raise RuntimeError(f'app.database is already connected to {engine.url!r}, not {database}; run the benchmarks in a fresh process')
+    models.init_db(engine)
+    commit = git_commit()
+    results = []
+
+    def report(name, rows, seconds, peak):
+        result = {
+            'benchmark': name,
+            'rows': rows,
+            'seconds': round(seconds, 6),
+            'rows_per_second': round(rows / seconds, 1) if seconds > 0 else None,
+            'peak_memory_bytes': peak,
+            'commit': commit,
+            'python': platform.python_version(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+        }
+        results.append(result)
+        print(json.dumps(result), flush=True)
+
+    def bench(name, func, rows):
+        seconds, peak = measure(func, repeat=repeat, memory=memory)
+        report(name, rows, seconds, peak)
+
+    symbol = 'MES 06-24'
+    for size in sizes:
+        df = generate_ticks(size, symbols=(symbol,))
+        with SessionLocal() as db:
+            db.execute(delete(models.MarketData))
+            db.commit()
+        load_market_data(df, engine)
+        shutil.rmtree(os.environ['TICK_CACHE_DIR'], ignore_errors=True)
+        start_time, end_time = df['datetime'].min().to_pydatetime(), df['datetime'].max().to_pydatetime()
+        source = df[['symbol', 'datetime', 'last_price', 'trades', 'total_volume', 'total_buying_volume', 'total_selling_volume']]
+
+        bench('foot_print_transformation', lambda: main.foot_print_transformation(source.copy()), size)
+        footprint = main.foot_print_transformation(source.copy())
+
+        # the single-candle detectors of main.py over the first max_candles candles (rows = candles)
+        candles = [c.reset_index(drop=True) for _, c in footprint.groupby('Time')][:max_candles]
+        def per_candle(detector):
+            return lambda: [detector(candle) for candle in candles]
+        bench('volume_cluster', per_candle(main.volume_cluster), len(candles))
+        bench('imbalance', per_candle(main.imbalance), len(candles))
+        bench('multiple_high_volume_node', per_candle(main.multiple_high_volume_node), len(candles))
+        bench('zero_print', per_candle(main.zero_print), len(candles))
+        bench('failed_auction', per_candle(main.failed_auction), len(candles))
+        # the live detector pipeline over the same candles, converted to arrays once
+        pipeline_candles = [Candle.from_frame(candle) for candle in candles]
+        def run_pipeline():
+            pipeline = DetectorPipeline()
+            return [pipeline.run(candle) for candle in pipeline_candles]
+        bench('pipeline', run_pipeline, len(candles))
+        # vectorized detectors over every candle (rows = footprint rows)
+        bench('detectors.detect_all', lambda: detectors.detect_all(footprint), len(footprint))
+
+        bench('bid_ask_spread', lambda: liquidity_index.bid_ask_spread(source.copy(), time_frame_min=5), size)
+        bench('turn_over_ratio', lambda: liquidity_index.turn_over_ratio(source.copy(), time_frame_min=5), size)
+        bench('liquidity_indices', lambda: liquidity_index.liquidity_indices(source), size)
+        bench('get_liquidity_index', lambda: liquidity_index.get_liquidity_index(start_time, end_time, symbol=symbol, time_frame_min=5, use_cache=False), size)
+        bench('get_liquidity_index_cached', lambda: liquidity_index.get_liquidity_index(start_time, end_time, symbol=symbol, time_frame_min=5), size)
+    return results
+
+def load_results(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+# print time and memory ratios of `current` against `baseline` (ratio > 1: slower / more memory)
+def compare(baseline, current):
+    previous = {(r['benchmark'], r['rows']): r for r in baseline}
+    print(f"{'benchmark':32} {'rows':>10} {'time':>8} {'memory':>8}")
+    for result in current:
+        old = previous.get((result['benchmark'], result['rows']))
+        if old is None:
+            continue
+        time_ratio = result['seconds'] / old['seconds'] if old['seconds'] else float('nan')
+        memory_ratio = result['peak_memory_bytes'] / old['peak_memory_bytes'] if old.get('peak_memory_bytes') and result.get('peak_memory_bytes') else float('nan')
+        print(f"{result['benchmark']:32} {result['rows']:>10} {time_ratio:>7.2f}x {memory_ratio:>7.2f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the footprint and liquidity pipelines on synthetic data')
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES, help='number of synthetic rows (up to 10000000)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-candles', type=int, default=500, help='candles used for the single-candle detectors')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc run')
+    parser.add_argument('--workdir', default=None, help='directory for the SQLite database and tick cache (default: a temp dir)')
+    parser.add_argument('--output', default=None, help='also write the JSON lines to this file')
+    parser.add_argument('--compare', default=None, help='JSON lines of a previous run to compare against')
+    args = parser.parse_args()
+
+    results = run(args.sizes, repeat=args.repeat, memory=not args.no_memory, max_candles=args.max_candles, workdir=args.workdir)
+    if args.output:
+        with open(args.output, 'w') as f:
+            for result in results:
+                f.write(json.dumps(result) + '\n')
+    if args.compare:
+        compare(load_results(args.compare), results)
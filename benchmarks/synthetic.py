@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+# Seeded synthetic market_data rows: one row per second per symbol, a price random walk on a tick grid
+# (mostly one-tick moves with occasional jumps) and bid/ask volumes that add up to the total volume.
+# Every market_data column is filled so the rows can be inserted into the table as they are.
+def generate_ticks(n_rows, symbols = ('MES 06-24',), seed = 0, start = '2024-05-01 09:30:00', tick_size = 0.25, start_price = 5000.0):
+    rng = np.random.default_rng(seed)
+    per_symbol = int(np.ceil(n_rows / len(symbols)))
+    frames = []
+    for i, symbol in enumerate(symbols):
+        n = min(per_symbol, n_rows - i * per_symbol)
+        if n <= 0:
+            break
+        # price walk in ticks: -1/0/+1 most of the time, a few larger jumps
+        steps = rng.choice([-1, 0, 1], size=n, p=[0.3, 0.4, 0.3])
+        jumps = rng.random(n) < 0.01
+        steps[jumps] = rng.integers(-6, 7, jumps.sum())
+        price = start_price + np.cumsum(steps) * tick_size
+        total = rng.poisson(20, n) + 1
+        buying = rng.binomial(total, rng.beta(2, 2, n))
+        selling = total - buying
+        trades = np.maximum(1, rng.binomial(total, 0.4))
+        delta = buying - selling
+        frames.append(pd.DataFrame({
+            'symbol': symbol,
+            'datetime': pd.Timestamp(start) + pd.to_timedelta(np.arange(n), unit='s'),
+            'last_price': price,
+            'trades': trades,
+            'total_volume': total,
+            'total_buying_volume': buying,
+            'total_selling_volume': selling,
+            'bar_delta': delta,
+            'delta_percent': delta / total * 100,
+            'delta_for_price': delta,
+            'ask_volume_for_price': selling,
+            'bid_volume_for_price': buying,
+            'total_volume_for_price': total,
+            'max_ask_volume': selling,
+            'price_with_max_ask_volume': price.astype(str),
+            'max_bid_volume': buying,
+            'price_with_max_bid_volume': price.astype(str),
+            'max_combined_volume': total,
+            'price_with_max_combined_volume': price.astype(str),
+            'max_positive_delta': np.maximum(delta, 0),
+            'max_negative_delta': np.minimum(delta, 0),
+            'max_seen_delta': np.maximum.accumulate(delta),
+            'min_seen_delta': np.minimum.accumulate(delta),
+            'cumulative_delta': np.cumsum(delta),
+        }))
+    df = pd.concat(frames, ignore_index=True)
+    df.insert(loc=0, column='id', value=np.arange(1, len(df) + 1))
+    return df
+
+# insert generated rows into market_data in chunks
+def load_market_data(df, engine, chunk_size = 100000):
+    for i in range(0, len(df), chunk_size):
+        df.iloc[i:i + chunk_size].to_sql('market_data', engine, if_exists='append', index=False)
@@ -0,0 +1,137 @@
+import os
+import logging
+import argparse
+from datetime import datetime, time, timedelta
+from urllib.parse import quote
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from app import crud
+from app.database import SessionLocal, engine
+from app.footprint import footprint_one_minute
+from liquidity_index import DEFAULT_TIME_FRAMES, minute_summary, liquidity_from_summary
+
+logger = logging.getLogger(__name__)
+
+# Parallel backfill of liquidity indices for many symbols over a long range.
+# The job is split into (symbol, day) partitions that run on a process pool. Each partition is reduced to its
+# per-minute partial sums (liquidity_index.minute_summary) and saved to <work_dir>/<symbol>/<YYYY-MM-DD>.npz.
+# A file is marked complete when the symbol already had rows more than COMPLETE_GRACE past the end of its day (so
+# rows still being ingested, or timestamps behind the local clock, cannot freeze partial sums), and complete files
+# are never recomputed, so a crashed or interrupted run resumes where it stopped. Files written while their day could
+# still grow are recomputed by every run until they are written complete.
+# Every symbol's minutes are then concatenated and re-aggregated per time frame. A candle that crosses midnight is
+# therefore combined from both days, exactly as if the range had been computed in one piece.
+#
+#   python liquidity_backfill.py --symbols "MES 06-24" "ES 06-24" --start 2024-03-01 --end 2024-05-31 --workers 8
+
+SUMMARY_COLUMNS = ['PriceXBid', 'PriceXAsk', 'Bid', 'Ask', 'Trades', 'TotalVolume', 'Max_Bid', 'Min_Ask']
+# a day is complete once the symbol has rows this long after its end
+COMPLETE_GRACE = timedelta(minutes=10)
+
+def partition_path(work_dir, symbol, day):
+    return os.path.join(work_dir, quote(symbol, safe=''), f'{day.isoformat()}.npz')
+
+def days_between(start_time, end_time):
+    return [start_time.date() + timedelta(days=i) for i in range((end_time.date() - start_time.date()).days + 1)]
+
+# complete is False for a day that can still receive rows; such a partition is recomputed by every run
+def write_summary(path, summary, complete):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.tmp-{os.getpid()}.npz'
+    np.savez(tmp, complete=complete, Time=summary['Time'].to_numpy(dtype='datetime64[ns]'), **{name: summary[name].to_numpy(dtype=float) for name in SUMMARY_COLUMNS})
+    # a partition file only exists once it is fully written
+    os.replace(tmp, path)
+
+# True when the partition file exists and was written complete
+def is_complete(path):
+    if not os.path.exists(path):
+        return False
+    with np.load(path) as data:
+        return 'complete' in data.files and bool(data['complete'])
+
+def read_summary(path):
+    with np.load(path) as data:
+        return pd.DataFrame({name: data[name] for name in ['Time'] + SUMMARY_COLUMNS})
+
+# process pool initializer: connections inherited from the parent process must not be shared, so every worker
+# drops them and opens its own
+def init_worker():
+    engine.dispose(close=False)
+
+# per-minute partial sums of one symbol and day, written to work_dir; returns the number of market_data rows
+def backfill_partition(symbol, day, work_dir, grace = COMPLETE_GRACE):
+    end_of_day = datetime.combine(day, time.max)
+    with SessionLocal() as db:
+        # read before the day's rows, so a day found complete cannot gain rows between the two queries
+        _, last = crud.get_market_data_time_bounds(db, symbol)
+        df = crud.get_market_data_frame(db, symbol, start_time=datetime.combine(day, time.min), end_time=end_of_day)
+    summary = minute_summary(footprint_one_minute(df)) if not df.empty else pd.DataFrame(columns=['Time'] + SUMMARY_COLUMNS)
+    write_summary(partition_path(work_dir, symbol, day), summary, complete=last is not None and last > end_of_day + grace)
+    return len(df)
+
+# partitions that still have to run (missing files and files written before their day was over)
+def pending_partitions(symbols, days, work_dir):
+    return [(symbol, day) for symbol in symbols for day in days if not is_complete(partition_path(work_dir, symbol, day))]
+
+# liquidity indices of every symbol and time frame from the partition files, as one DataFrame with columns
+# Symbol, Time_Frame, Time, Bid_Ask_Spread, Weighted_Bid_Ask_Spread, Turnover_Ratio
+# (start_time and end_time select whole minutes)
+def combine(symbols, start_time, end_time, work_dir, time_frames = DEFAULT_TIME_FRAMES):
+    frames = []
+    for symbol in symbols:
+        summary = pd.concat([read_summary(partition_path(work_dir, symbol, day)) for day in days_between(start_time, end_time)], ignore_index=True)
+        summary = summary[(summary['Time'] >= pd.Timestamp(start_time).floor('Min')) & (summary['Time'] <= pd.Timestamp(end_time))]
+        if summary.empty:
+            continue
+        for time_frame_min in time_frames:
+            result = liquidity_from_summary(summary, time_frame_min)
+            result.insert(loc=0, column='Time_Frame', value=time_frame_min)
+            result.insert(loc=0, column='Symbol', value=symbol)
+            frames.append(result)
+    if not frames:
+        return pd.DataFrame(columns=['Symbol', 'Time_Frame', 'Time', 'Bid_Ask_Spread', 'Weighted_Bid_Ask_Spread', 'Turnover_Ratio'])
+    return pd.concat(frames, ignore_index=True)
+
+# run the pending partitions on max_workers processes, then combine them. If a partition fails, the others still
+# finish and are kept, and a RuntimeError is raised; running the same backfill again only retries what is missing.
+def backfill(symbols, start_time, end_time, work_dir = 'liquidity_backfill', time_frames = DEFAULT_TIME_FRAMES, max_workers = None):
+    days = days_between(start_time, end_time)
+    pending = pending_partitions(symbols, days, work_dir)
+    logger.info('%d of %d partitions to compute', len(pending), len(symbols) * len(days))
+    failed = []
+    if pending:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker) as executor:
+            futures = {executor.submit(backfill_partition, symbol, day, work_dir): (symbol, day) for symbol, day in pending}
+            for done, future in enumerate(as_completed(futures), 1):
+                symbol, day = futures[future]
+                if future.exception() is not None:
+                    logger.error('%s %s failed: %s', symbol, day, future.exception())
+                    failed.append((symbol, day))
+                else:
+                    logger.info('[%d/%d] %s %s: %d rows', done, len(pending), symbol, day, future.result())
+    if failed:
+        raise RuntimeError(f'{len(failed)} partition(s) failed, run the backfill again to retry them')
+    return combine(symbols, start_time, end_time, work_dir, time_frames=time_frames)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    parser = argparse.ArgumentParser(description='Backfill liquidity indices for many symbols and days on a process pool')
+    parser.add_argument('--symbols', nargs='+', default=None, help='default: every symbol in market_data')
+    parser.add_argument('--start', type=datetime.fromisoformat, required=True)
+    parser.add_argument('--end', type=datetime.fromisoformat, required=True)
+    parser.add_argument('--time-frames', nargs='+', type=int, default=DEFAULT_TIME_FRAMES)
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: number of CPUs)')
+    parser.add_argument('--work-dir', default='liquidity_backfill', help='partition files, kept to resume an interrupted run')
+    parser.add_argument('--output', default='liquidity_backfill.csv')
+    args = parser.parse_args()
+
+    symbols = args.symbols
+    if symbols is None:
+        with SessionLocal() as db:
+            symbols = crud.get_symbols(db)
+    result = backfill(symbols, args.start, args.end, work_dir=args.work_dir, time_frames=args.time_frames, max_workers=args.workers)
+    result.to_csv(args.output, index=False)
+    logger.info('%d rows written to %s', len(result), args.output)
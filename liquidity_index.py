@@ -5,13 +5,12 @@ from datetime import datetime, timedelta
 
 from app import models, crud, schemas
 from app.database import SessionLocal, engine
+from app.tick_cache import TickCache
+from app.footprint import footprint_one_minute
 import pandas as pd
 import numpy as np
 import csv
 
-# Initialize the database
-models.Base.metadata.create_all(bind=engine)
-
 def get_db():
     db = SessionLocal()
     try:
@@ -20,26 +19,26 @@ def get_db():
         db.close()
 
 # Fetch data function can specify start_time and end_time
-def fetch_and_print_data(start_time = datetime.min, end_time = datetime.now(), symbol = 'MES 06-24'):
+# with use_cache, past days are read from the local tick cache and only missing or newest days come from the database
+def fetch_and_print_data(start_time = datetime.min, end_time = datetime.now(), symbol = 'MES 06-24', use_cache = True):
     with next(get_db()) as db:
-        curr_time = datetime.now()
-        market_data = crud.get_market_data_by_symbol_time(db, symbol=symbol, start_time= start_time, end_time = end_time)
-        data = [result.__dict__ for result in market_data]
-    
-    # Remove the SQLAlchemy instance state from each dictionary
-    for item in data:
-        item.pop('_sa_instance_state', None)
-    
-    # Convert to a DataFrame
-    df = pd.DataFrame(data)
+        if use_cache:
+            return TickCache().load(db, symbol, start_time, end_time)
+        # only the columns used by the liquidity functions, straight into a DataFrame
+        df = crud.get_market_data_frame(db, symbol, start_time= start_time, end_time = end_time)
     return df
 
+# round times down to the beginning of their time_frame_min candle
+# candles are counted from 1970-01-01 00:00, so frames over 60 minutes or frames that do not divide an hour stay evenly spaced
+def floor_time(times, time_frame_min):
+    return pd.to_datetime(times).dt.floor(f'{time_frame_min}min')
+
 # function to transform data to footprint data. This function allow to select time length for each footprint candle
 def footprint_transformation_time_frame(df, time_frame_min=1):
     df = df[['symbol','datetime','last_price','trades', 'total_volume', 'total_buying_volume','total_selling_volume']]
     df.columns = ['Symbol', 'Time', 'Price', 'Trades', 'TotalVolume', 'Bid', 'Ask']
     # This is to round down to time to the beginning of candle's time frame
-    df['Time'] = df['Time'].apply(lambda t: datetime(t.year, t.month, t.day, t.hour,time_frame_min*(t.minute // time_frame_min)))
+    df['Time'] = floor_time(df['Time'], time_frame_min)
 
     #Create footprint chart data
     footprint_data = df.groupby(['Time', 'Price']).agg(
@@ -79,7 +78,7 @@ def bid_ask_spread(df, time_frame_min = 1):
 # turn_over function takes second-by-second data as an input
 def turn_over_ratio(df, time_frame_min = 1):
     # This is to round down to time to the beginning of candle's time frame
-    df['Time'] = df['datetime'].apply(lambda t: datetime(t.year, t.month, t.day, t.hour,time_frame_min*(t.minute // time_frame_min)))
+    df['Time'] = floor_time(df['datetime'], time_frame_min)
     # sum traded and total trading volume
     turnover_df = df.groupby(['Time']).agg(
         Trades=('trades', 'sum'),  # Sum the 'Bid' column
@@ -89,16 +88,115 @@ def turn_over_ratio(df, time_frame_min = 1):
     turnover_df['Turnover_Ratio'] = turnover_df['Trades']/turnover_df['TotalVolume']
     turnover_df = turnover_df[['Time','Turnover_Ratio']]
     return turnover_df
-# This function is to get all indices, including bid-ask spread, weighted bid-ask spread, and turnover ratio, at once
-def get_liquidity_index(start_time = datetime.min, end_time = datetime.now(), symbol = 'MES 06-24', time_frame_min = 1):
-    df = fetch_and_print_data(start_time, end_time, symbol= symbol)
-    BidAsk = bid_ask_spread(df, time_frame_min=time_frame_min)
-    turnover = turn_over_ratio(df, time_frame_min=time_frame_min)
-    result = pd.merge(BidAsk, turnover, on='Time', how='left')
+# time frames (minutes) computed by default by liquidity_indices()
+DEFAULT_TIME_FRAMES = [1, 5, 15, 30, 60, 240]
+
+# per-minute partial sums of a 1-minute footprint; every liquidity index of any time frame can be re-aggregated from them
+# (sums add up, Max_Bid takes the max and Min_Ask the min)
+def minute_summary(footprint):
+    price = footprint['Price']
+    partials = pd.DataFrame({
+        'Time': footprint['Time'],
+        'PriceXBid': price * footprint['Bid'],
+        'PriceXAsk': price * footprint['Ask'],
+        'Bid': footprint['Bid'],
+        'Ask': footprint['Ask'],
+        'Trades': footprint['Trades'],
+        'TotalVolume': footprint['Volume'],
+        # highest price with bids and lowest price with asks
+        'Max_Bid': price.where(footprint['Bid'] != 0),
+        'Min_Ask': price.where(footprint['Ask'] != 0),
+    })
+    return combine_partials(partials, 'Time')
+
+# aggregate partial sums by `by` (a column name or a Series of bucket times)
+def combine_partials(partials, by):
+    return partials.groupby(by).agg(
+        PriceXBid=('PriceXBid', 'sum'),
+        PriceXAsk=('PriceXAsk', 'sum'),
+        Bid=('Bid', 'sum'),
+        Ask=('Ask', 'sum'),
+        Trades=('Trades', 'sum'),
+        TotalVolume=('TotalVolume', 'sum'),
+        Max_Bid=('Max_Bid', 'max'),
+        Min_Ask=('Min_Ask', 'min'),
+    ).rename_axis('Time').reset_index()
+
+# bid-ask spread, weighted bid-ask spread and turnover ratio of the time_frame_min candles of a minute summary
+def liquidity_from_summary(summary, time_frame_min = 1):
+    buckets = combine_partials(summary, floor_time(summary['Time'], time_frame_min))
+    weighted_bid = buckets['PriceXBid'] / buckets['Bid'].where(buckets['Bid'] != 0)
+    weighted_ask = buckets['PriceXAsk'] / buckets['Ask'].where(buckets['Ask'] != 0)
+    result = pd.DataFrame({
+        'Time': buckets['Time'],
+        'Bid_Ask_Spread': buckets['Min_Ask'] - buckets['Max_Bid'],
+        'Weighted_Bid_Ask_Spread': weighted_ask - weighted_bid,
+        'Turnover_Ratio': buckets['Trades'] / buckets['TotalVolume'],
+    })
+    # candles without any bid have no spread (same as bid_ask_spread())
+    return result[buckets['Max_Bid'].notna()].reset_index(drop=True)
+
+# all indices for several time frames in one pass: the 1-minute footprint is built once and every
+# time frame is re-aggregated from its per-minute sums. Returns {time_frame_min: DataFrame}
+def liquidity_indices(df, time_frames = DEFAULT_TIME_FRAMES):
+    return liquidity_indices_from_footprint(footprint_one_minute(df), time_frames=time_frames)
+
+# same as liquidity_indices() starting from a 1-minute footprint (e.g. rows of footprint_bars)
+def liquidity_indices_from_footprint(footprint, time_frames = DEFAULT_TIME_FRAMES):
+    summary = minute_summary(footprint)
+    return {time_frame_min: liquidity_from_summary(summary, time_frame_min) for time_frame_min in time_frames}
+
+# Out-of-core version of liquidity_indices() for chunks of market_data rows in datetime order (e.g. from
+# crud.iter_market_data_frames). Each chunk is reduced to per-minute sums, then to partial sums per time_frame_min
+# bucket. Only the last bucket of a chunk can continue in the next chunk, so it is carried over and merged, and
+# every earlier bucket is final. Memory is bounded by the number of output buckets, not by the number of rows.
+# Returns {time_frame_min: DataFrame}, same as liquidity_indices() on all rows at once.
+def stream_liquidity_indices(chunks, time_frames = DEFAULT_TIME_FRAMES):
+    done = {time_frame_min: [] for time_frame_min in time_frames}
+    carry = {time_frame_min: None for time_frame_min in time_frames}
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        summary = minute_summary(footprint_one_minute(chunk))
+        for time_frame_min in time_frames:
+            buckets = combine_partials(summary, floor_time(summary['Time'], time_frame_min))
+            if carry[time_frame_min] is not None:
+                buckets = combine_partials(pd.concat([carry[time_frame_min], buckets]), 'Time')
+            last = buckets['Time'].iloc[-1]
+            done[time_frame_min].append(buckets[buckets['Time'] < last])
+            carry[time_frame_min] = buckets[buckets['Time'] == last]
+    result = {}
+    for time_frame_min in time_frames:
+        parts = done[time_frame_min] + ([carry[time_frame_min]] if carry[time_frame_min] is not None else [])
+        if not parts:
+            result[time_frame_min] = pd.DataFrame(columns=['Time', 'Bid_Ask_Spread', 'Weighted_Bid_Ask_Spread', 'Turnover_Ratio'])
+            continue
+        result[time_frame_min] = liquidity_from_summary(pd.concat(parts, ignore_index=True), time_frame_min)
     return result
 
+# This function is to get all indices, including bid-ask spread, weighted bid-ask spread, and turnover ratio, at once
+def get_liquidity_index(start_time = datetime.min, end_time = datetime.now(), symbol = 'MES 06-24', time_frame_min = 1, use_cache = True, use_bars = False, stream = False):
+    return get_liquidity_indices(start_time, end_time, symbol=symbol, time_frames=[time_frame_min], use_cache=use_cache, use_bars=use_bars, stream=stream)[time_frame_min]
+
+# same as get_liquidity_index() for several time frames at once, returns {time_frame_min: DataFrame}
+# with use_bars, the 1-minute footprint is read from footprint_bars (see app.rollup) instead of second-by-second data
+# with stream, market_data is read from the database in chunks of chunk_size rows (no cache), for ranges too large for memory
+def get_liquidity_indices(start_time = datetime.min, end_time = datetime.now(), symbol = 'MES 06-24', time_frames = DEFAULT_TIME_FRAMES, use_cache = True, use_bars = False, stream = False, chunk_size = 100000):
+    if stream:
+        with next(get_db()) as db:
+            return stream_liquidity_indices(crud.iter_market_data_frames(db, symbol, start_time=start_time, end_time=end_time, chunk_size=chunk_size), time_frames=time_frames)
+    if use_bars:
+        with next(get_db()) as db:
+            footprint = crud.get_footprint_bars(db, symbol, start_time=start_time, end_time=end_time)
+        return liquidity_indices_from_footprint(footprint, time_frames=time_frames)
+    df = fetch_and_print_data(start_time, end_time, symbol= symbol, use_cache=use_cache)
+    return liquidity_indices(df, time_frames=time_frames)
+
 # Get indices and print (can adjust time frame of indices)
-result = get_liquidity_index(time_frame_min=30)
-print(result.head(20))
+if __name__ == "__main__":
+    # Initialize the database
+    models.init_db(engine)
+    result = get_liquidity_index(time_frame_min=30)
+    print(result.head(20))
 
 
@@ -3,14 +3,21 @@ from sqlalchemy.orm import Session
 from typing import List
 from datetime import datetime, timedelta
 
-from app import models, crud, schemas, notification
+from app import models, crud, schemas, notification, detectors
 from app.database import SessionLocal, engine
+from app.footprint import FootprintAggregator
+from app.scheduler import MinuteScheduler
+from app.metrics import Metrics, NULL_METRICS
+from app.event_store import EventStore
+from app.pipeline import DetectorPipeline
+from app.instruments import get_instrument, DEFAULT_INSTRUMENT
+from app.tick_source import PollingTickSource
+from app.volume_profile import load_profile, profile_path, catch_up
 import pandas as pd
-import numpy as np
 import csv
+import argparse
+import logging
 
-# Initialize the database
-models.Base.metadata.create_all(bind=engine)
 # Add more tickers to the infinite loop here
 tickers = ['MES 06-24', 'ES 06-24']
 
@@ -26,15 +33,8 @@ def get_db():
 def fetch_and_print_latest_data():
     with next(get_db()) as db:
         curr_time = datetime.now()
-        market_data = crud.get_market_data_by_symbol_time(db, symbol='MES 06-24', start_time= curr_time - timedelta(minutes=1), end_time=curr_time)
-        data = [result.__dict__ for result in market_data]
-    
-    # Remove the SQLAlchemy instance state from each dictionary
-    for item in data:
-        item.pop('_sa_instance_state', None)
-    
-    # Convert to a DataFrame
-    df = pd.DataFrame(data)
+        # only the columns used by the footprint, straight into a DataFrame
+        df = crud.get_market_data_frame(db, 'MES 06-24', start_time= curr_time - timedelta(minutes=1), end_time=curr_time)
     print(df.head())
     return df
 
@@ -42,15 +42,7 @@ def fetch_and_print_latest_data():
 def fetch_and_print_last_min_data(symbol = 'MES 06-24'):
     with next(get_db()) as db:
         curr_time = datetime.now().replace(second=0) - timedelta(seconds=1)
-        market_data = crud.get_market_data_by_symbol_time(db, symbol=symbol, start_time= curr_time - timedelta(minutes=1), end_time=curr_time)
-        data = [result.__dict__ for result in market_data]
-    
-    # Remove the SQLAlchemy instance state from each dictionary
-    for item in data:
-        item.pop('_sa_instance_state', None)
-    
-    # Convert to a DataFrame
-    df = pd.DataFrame(data)
+        df = crud.get_market_data_frame(db, symbol, start_time= curr_time - timedelta(minutes=1), end_time=curr_time)
     print(df.head())
     return df
 
@@ -61,20 +53,29 @@ def foot_print_transformation(df):
     df.columns = ['Symbol', 'Time', 'Price', 'Trades', 'TotalVolume', 'Bid', 'Ask']
     df['Time'] = pd.to_datetime(df['Time']).dt.floor('Min')
 
-    #Create footprint chart data (compute bid and ask at prices in a time period)
-    footprint_data = df.groupby(['Time', 'Price']).agg(
+    #Create footprint chart data (compute bid and ask at prices in a time period, per symbol)
+    footprint_data = df.groupby(['Symbol', 'Time', 'Price']).agg(
         Bid=('Bid', 'sum'),
         Ask=('Ask', 'sum'),
         Volume=('TotalVolume', 'sum') 
     ).reset_index() 
 
     #sort value
-    footprint_data = footprint_data.sort_values(by=['Time', 'Price'])
+    footprint_data = footprint_data.sort_values(by=['Symbol', 'Time', 'Price'])
     return(footprint_data)
 
+# tick size of a single-candle footprint: the one of its symbol, or DEFAULT_INSTRUMENT's without a Symbol column
+def candle_tick_size(footprint):
+    if 'Symbol' not in footprint.columns:
+        return DEFAULT_INSTRUMENT.tick_size
+    return get_instrument(footprint.loc[0,'Symbol']).tick_size
+
 # Function to detect volume cluster
-def volume_cluster(footprint, tick_size = 0.25, cluster_param = 5):
+# (tick_size defaults to the tick size of the footprint's symbol, see app.instruments)
+def volume_cluster(footprint, tick_size = None, cluster_param = 5):
     result = pd.DataFrame()
+    if tick_size is None:
+        tick_size = candle_tick_size(footprint)
     #sort volume descending to see what prices have highest/lowest volume
     price_by_time = footprint.sort_values(by=['Volume'],ascending=False)
     #get time (there is only one time in a footprint data)
@@ -88,7 +89,8 @@ def volume_cluster(footprint, tick_size = 0.25, cluster_param = 5):
         max = price_by_time['Price'].max()
         min = price_by_time['Price'].min()
         #there is volume cluster if and only if number of tick between max and min; (max-min)/tick_price = cluster_param - 1
-        if (max - min)/tick_size == cluster_param-1:
+        #(compared in whole ticks, so float rounding of the prices cannot hide a cluster)
+        if round(max/tick_size) - round(min/tick_size) == cluster_param-1:
             result = pd.concat([result, pd.DataFrame([['Volume Cluster', time, max]],columns=['Event', 'Time', 'Price'])])
     if result.empty:
         result = pd.concat([result, pd.DataFrame([['NaN', time, 0]],columns=['Event', 'Time', 'Price'])])
@@ -96,52 +98,14 @@ def volume_cluster(footprint, tick_size = 0.25, cluster_param = 5):
     return result
 
 # Function to detect selling and buying imbalance
-def imbalance(footprint, tick_size = 0.25, stacked_param = 3, imbalance_param = 3):
+# (single candle wrapper around the vectorized detectors.stacked_imbalances kernel)
+def imbalance(footprint, tick_size = None, stacked_param = 3, imbalance_param = 3):
     time = footprint.loc[0,'Time']
-    #compute imbalance and preparing shifted data (we compute differnce between bid at price x and ask at price x+1_tick)
-    testdf = footprint.sort_values(by=['Price'],ascending=False)
-    temp = pd.DataFrame(np.arange (testdf['Price'].min(),testdf['Price'].max()+tick_size,tick_size)).rename(columns={0: "Price"})
-    temp = temp.sort_values(by=['Price'],ascending=False)
-    temp["Price_Up"] = temp['Price']+tick_size
-    temp = temp.merge(testdf[['Price','Bid']], how='left')
-    temp = temp.merge(testdf[['Price','Ask']], how='left', left_on='Price_Up', right_on='Price')
-    temp = temp.rename(columns={'Price_x': "Price"})
-    temp = temp[['Price','Bid','Ask']]
-    temp['imbalance'] = abs(temp['Bid'] - temp['Ask']) / np.minimum(temp['Bid'], temp['Ask'])
-    # to handle n/a and undefined error
-    temp.fillna(0, inplace=True)
-    temp = temp.replace([np.inf, -np.inf], 0)
-
-    # create a list of our conditions
-    conditions = [
-       (temp['imbalance'] >= imbalance_param) & (temp['Bid'] > temp['Ask']),
-       (temp['imbalance'] >= imbalance_param) & (temp['Bid'] < temp['Ask'])
-       ]
-    # create a list of the values we want to assign for each condition
-    values = ['Selling Imbalance', 'Buying Imbalance']
-    # create a new column and use np.select to assign values to it using our lists as arguments
-    temp['Imbalance_Flag'] = np.select(conditions, values)
-    data = temp[['Price', 'Imbalance_Flag']]
-    #start to find stack imbalance and set counting parameter
-    result = pd.DataFrame()
-    count = 0
-    stack_price = 0
-    current_flag = 'n'
-    for price, flag in data.itertuples(index=False):
-        # in case previous and current flag are the same, count + 1
-        if flag in ('Selling Imbalance', 'Buying Imbalance') and flag == current_flag:
-            count +=1
-            current_flag = flag
-        # if not, reset the count
-        else:
-            count = 1
-            current_flag = flag
-            stack_price = price
-        # Signal the event if count = imbalance parameter
-        if count == stacked_param:
-            result = pd.concat([result, pd.DataFrame([[flag, time, stack_price]],columns=['Event', 'Time', 'Price'])])
+    if tick_size is None:
+        tick_size = candle_tick_size(footprint)
+    result = detectors.stacked_imbalances(footprint[['Time', 'Price', 'Bid', 'Ask']], tick_size=tick_size, stacked_param=stacked_param, imbalance_param=imbalance_param)
     if result.empty:
-        result = pd.concat([result, pd.DataFrame([['NaN', time, 0]],columns=['Event', 'Time', 'Price'])])
+        result = pd.DataFrame([['NaN', time, 0]],columns=['Event', 'Time', 'Price'])
     
     return result
 
@@ -201,61 +165,134 @@ def failed_auction(footprint):
         result = pd.concat([result, pd.DataFrame([['NaN', time, 0]],columns=['Event', 'Time', 'Price'])])
     return result
 
+# run the detector pipeline on one closed candle, sent notifications and save found events to the event store
+# (events are buffered there and written once per cycle); every detector, notification and store is timed as a stage of `metrics`
+def detect_events(pipeline, candle, event_store, metrics=NULL_METRICS):
+    events = pipeline.run(candle, metrics=metrics)
+    if not events:
+        return events
+    with metrics.stage(candle.symbol, 'notify'):
+        for event in events:
+            notification.sent_msg(event.message())
+    with metrics.stage(candle.symbol, 'store'):
+        for event in events:
+            event_store.add(event.symbol, event.event, event.time, event.price)
+    return events
+
 # this is the main fuction that call all functions to query data, detect foot print events, and send notifications 
-def main():
-    # create a dictionary for last_price and multiple_count to be used as input for multiple_high_volume detection
-    last_price_dict = {ticker: 0 for ticker in tickers}
-    multiple_count_dict = {ticker: 1 for ticker in tickers}
-    # start time for log file
-    start_time = datetime.now().strftime("%Y-%m-%d_%H-%M")
-    # infinite loop to query data and event detection
-    while True:
-        # Loop for all tickers at the top
-        for ticker in tickers:
-            # Fetch last minute data, if error skip to the next loop
-            try:
-                df = fetch_and_print_last_min_data(ticker)
-            except Exception as e:
-                print(e)
-            if df.empty:
-                continue
-            # transform to foottprint data
-            footprint = foot_print_transformation(df)
-            # Detect volume cluster, if it is found sent notification and save to log file
-            cluster_result = volume_cluster(footprint)
-            cluster_result.insert(loc=0, column='Symbol', value=ticker)
-            if cluster_result['Price'][0] != 0:
-                notification.sent_msg(f"{cluster_result['Symbol'][0]}: {cluster_result['Event'][0]} at {cluster_result['Price'][0]} USD at {cluster_result['Time'].dt.strftime('%Y-%m-%d %H:%M')[0]}")
-                cluster_result.to_csv(f'log_{start_time}.csv', sep='\t', header=None, mode='a')
-            # Detect imbalance, if it is found sent notification and save to log file
-            imbalance_result = imbalance(footprint)
-            imbalance_result.insert(loc=0, column='Symbol', value=ticker)
-            if imbalance_result['Price'][0] != 0:
-                notification.sent_msg(f"{imbalance_result['Symbol'][0]}: {imbalance_result['Event'][0]} at {imbalance_result['Price'][0]} USD at {imbalance_result['Time'].dt.strftime('%Y-%m-%d %H:%M')[0]}")
-                imbalance_result.to_csv(f'log_{start_time}.csv', sep='\t', header=None, mode='a')
-            # Detect multiple high volume node, if it is found sent notification and save to log file
-            price, multiple_count_new, multiple_result = multiple_high_volume_node(footprint, n_node=2, last_price=last_price_dict[ticker], multiple_count=multiple_count_dict[ticker])
-            multiple_result.insert(loc=0, column='Symbol', value=ticker)
-            if multiple_result['Price'][0] != 0:
-                notification.sent_msg(f"{multiple_result['Symbol'][0]}: {multiple_result['Event'][0]} at {multiple_result['Price'][0]} USD at {multiple_result['Time'].dt.strftime('%Y-%m-%d %H:%M')[0]}")
-                multiple_result.to_csv(f'log_{start_time}.csv', sep='\t', header=None, mode='a')
-            last_price_dict[ticker] = price
-            multiple_count_dict[ticker] = multiple_count_new
-            # Detect zero print, if it is found sent notification and save to log file
-            zero_print_result = zero_print(footprint)
-            zero_print_result.insert(loc=0, column='Symbol', value=ticker)
-            if zero_print_result['Price'].iloc[0] != 0:
-                notification.sent_msg(f"{zero_print_result['Symbol'].iloc[0]}: {zero_print_result['Event'].iloc[0]} at {zero_print_result['Price'].iloc[0]} USD at {zero_print_result['Time'].dt.strftime('%Y-%m-%d %H:%M').iloc[0]}")
-                zero_print_result.to_csv(f'log_{start_time}.csv', sep='\t', header=None, mode='a')
-            # Detect failed auction, if it is found sent notification and save to log file
-            failed_auction_result = failed_auction(footprint)
-            failed_auction_result.insert(loc=0, column='Symbol', value=ticker)
-            if failed_auction_result['Price'].iloc[0] != 0:
-                notification.sent_msg(f"{failed_auction_result['Symbol'].iloc[0]}: {failed_auction_result['Event'].iloc[0]} at {failed_auction_result['Price'].iloc[0]} USD at {failed_auction_result['Time'].dt.strftime('%Y-%m-%d %H:%M').iloc[0]}")
-                failed_auction_result.to_csv(f'log_{start_time}.csv', sep='\t', header=None, mode='a')
-        
-        # once loop all the tickers in a minute, stop for 60 secs to do another loop. This is to make sure that we get data from different time period
-        time.sleep(60)
+# new rows are polled every poll_ms milliseconds (see app.tick_source) and a minute is closed and evaluated offset_ms
+# after it ends; tickers are processed concurrently by at most max_workers threads
+def main(offset_ms = 500, max_workers = 8, poll_ms = 250):
+    # every registered detector (see app.pipeline); the pipeline keeps the per-ticker detector state between candles
+    pipeline = DetectorPipeline()
+    # start from the beginning of the previous minute; rows of earlier minutes are counted as late and ignored
+    first_minute = datetime.now().replace(second=0, microsecond=0) - timedelta(minutes=1)
+    # one footprint aggregator per ticker keeps the open (minute, price) bins between cycles
+    aggregators = {ticker: FootprintAggregator(ticker) for ticker in tickers}
+    for aggregator in aggregators.values():
+        aggregator.closed_until = pd.Timestamp(first_minute)
+    # rows are read by id above the last one seen, so every row is read exactly once (with a single writer, see app.tick_source)
+    source = PollingTickSource(tickers)
+    source.start_at(first_minute)
+    close_delay = timedelta(milliseconds=offset_ms)
+    # found events are buffered and written to the event store once per cycle (see app.event_store)
+    event_store = EventStore()
+    # session volume profile of every ticker, updated with each closed candle and restored from its snapshot;
+    # the candles that closed while the loop was stopped (before first_minute) are added from the database
+    profiles = {ticker: load_profile(ticker) for ticker in tickers}
+    with next(get_db()) as db:
+        for ticker, profile in profiles.items():
+            if catch_up(profile, db, first_minute):
+                profile.save(profile_path(ticker))
+    # per-stage timings (enabled with METRICS_ENABLED=1, see app.metrics)
+    metrics = Metrics.from_env()
+
+    # fetch the new rows of all tickers with one query at the start of each cycle, if error skip the cycle
+    def fetch_cycle(cycle_time):
+        metrics.start_cycle()
+        try:
+            with metrics.stage('*', 'fetch') as stage:
+                frames = source.poll()
+                stage.rows = sum(len(df) for df in frames.values())
+            return frames
+        except Exception as e:
+            print(e)
+            return {}
+
+    # job for one ticker; every minute that ended at least offset_ms before cycle_time is closed
+    def process_ticker(ticker, cycle_time, df):
+        if df is None:
+            return
+        with metrics.stage(ticker, 'footprint') as stage:
+            stage.rows = len(df)
+            aggregators[ticker].update(df)
+            # while the source is still reading a backlog, the rows of past minutes may not all be in yet
+            candles = aggregators[ticker].close_candles(pd.Timestamp(cycle_time - close_delay).floor('Min')) if source.caught_up else []
+        # detect events on every candle that closed since the last cycle
+        for candle in candles:
+            detect_events(pipeline, candle, event_store, metrics=metrics)
+            metrics.record_close(ticker, candle.time)
+        # add the closed candles to the session profile and save its snapshot
+        if candles:
+            with metrics.stage(ticker, 'profile'):
+                for candle in candles:
+                    profiles[ticker].add_candle(candle)
+                profiles[ticker].save(profile_path(ticker))
+
+    # once all tickers of a cycle are done, send the alerts of this cycle together (in the background) and write its events
+    def end_cycle(cycle_time):
+        notification.flush()
+        with metrics.stage('*', 'store') as stage:
+            stage.rows = event_store.flush()
+        metrics.end_cycle(cycle_time)
+
+    # a poll cycle is only reported as overrun when it delays closing a minute
+    scheduler = MinuteScheduler(interval=poll_ms / 1000, offset_ms=0, max_workers=max_workers, budget=max(offset_ms / 1000, poll_ms / 1000))
+    try:
+        scheduler.run(tickers, process_ticker, before_cycle=fetch_cycle, after_cycle=end_cycle)
+    finally:
+        source.close()
+
+# replay historical data of several symbols through all detectors without sending notifications
+# every candle in the range is evaluated at once by the vectorized detectors, and found events are written to a csv file
+def replay(symbols, start_time, end_time, output=None, use_bars=False):
+    # load the whole range with one query (with use_bars, the footprint comes straight from footprint_bars)
+    with next(get_db()) as db:
+        if use_bars:
+            footprint = crud.get_footprint_bars(db, symbols, start_time=start_time, end_time=end_time)
+        else:
+            df = crud.get_market_data_frame(db, symbols, start_time=start_time, end_time=end_time)
+            # footprint of every minute of every symbol
+            footprint = foot_print_transformation(df) if not df.empty else df
+    if footprint.empty:
+        print('No data to replay')
+        return pd.DataFrame(columns=['Symbol', 'Event', 'Time', 'Price'])
+    # every detector over all candles
+    events = detectors.detect_all(footprint)
+    if output is None:
+        output = f"replay_{start_time.strftime('%Y-%m-%d_%H-%M')}_{end_time.strftime('%Y-%m-%d_%H-%M')}.csv"
+    events.to_csv(output, index=False)
+    print(f'{len(events)} events from {footprint.shape[0]} footprint rows written to {output}')
+    return events
 
 if __name__ == "__main__":
-    main()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    parser = argparse.ArgumentParser(description='Footprint event detection')
+    parser.add_argument('--offset-ms', type=int, default=500, help='close each minute this many milliseconds after it ends')
+    parser.add_argument('--poll-ms', type=int, default=250, help='poll for new rows every this many milliseconds')
+    parser.add_argument('--workers', type=int, default=8, help='number of tickers processed concurrently')
+    subparsers = parser.add_subparsers(dest='command')
+    replay_parser = subparsers.add_parser('replay', help='run all detectors over historical data without notifications')
+    replay_parser.add_argument('--symbols', nargs='+', default=tickers)
+    replay_parser.add_argument('--start', type=datetime.fromisoformat, required=True)
+    replay_parser.add_argument('--end', type=datetime.fromisoformat, required=True)
+    replay_parser.add_argument('--output', default=None)
+    replay_parser.add_argument('--bars', action='store_true', help='read the footprint from footprint_bars instead of market_data')
+    args = parser.parse_args()
+
+    # Initialize the database
+    models.init_db(engine)
+    if args.command == 'replay':
+        replay(args.symbols, args.start, args.end, output=args.output, use_bars=args.bars)
+    else:
+        main(offset_ms=args.offset_ms, max_workers=args.workers, poll_ms=args.poll_ms)